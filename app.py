@@ -1,5 +1,7 @@
 import os
 import hashlib
+import hmac
+import re
 import qrcode
 import requests
 import random
@@ -9,12 +11,28 @@ import uuid
 import pytz
 import io
 import csv
-import colorsys
+import json
+import queue
+import select
+import time
+import unicodedata
+import click
 import base64
 import urllib.parse
+import threading
+import shutil
+import glob
+import zipfile
+import multiprocessing
+
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
 
 from fpdf import FPDF, XPos, YPos
-from datetime import datetime
+from fpdf.image_parsing import preload_image
+from datetime import datetime, timedelta
 from PIL import Image, ImageDraw, ImageFont as PILImageFont, ImageOps
 
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -22,8 +40,11 @@ from werkzeug.utils import secure_filename
 from flask import (Flask, request, jsonify, render_template, url_for, Response,
                    send_from_directory, redirect, flash, abort, make_response)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from dotenv import load_dotenv
+import numpy as np
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -88,13 +109,24 @@ login_manager.login_message_category = "info"
 # Nomes das subpastas dentro do STORAGE_BASE_PATH para arquivos persistentes
 PARTY_LOGOS_FOLDER_NAME = 'party_logos'
 PAYMENT_QRCODES_FOLDER_NAME = 'payment_qrcodes'
+INVITE_CARDS_FOLDER_NAME = 'invite_cards'
 
 # Caminhos completos para SALVAR os arquivos, agora baseados em STORAGE_BASE_PATH
 PARTY_LOGOS_SAVE_PATH = os.path.join(STORAGE_BASE_PATH, PARTY_LOGOS_FOLDER_NAME)
 PAYMENT_QRCODES_SAVE_PATH = os.path.join(STORAGE_BASE_PATH, PAYMENT_QRCODES_FOLDER_NAME)
+INVITE_CARDS_CACHE_PATH = os.path.join(STORAGE_BASE_PATH, INVITE_CARDS_FOLDER_NAME)
+
+# Quantidade máxima de convites renderizados mantidos em memória por worker
+INVITE_CARD_CACHE_SIZE = int(os.environ.get('INVITE_CARD_CACHE_SIZE', 256))
+
+# Por quantos segundos as estatísticas de uma festa ficam em cache por worker (0 desliga o cache)
+PARTY_STATS_CACHE_TTL = float(os.environ.get('PARTY_STATS_CACHE_TTL', 5))
 
 # A fonte é um recurso da aplicação, não precisa ser persistente no disco de dados
-FONT_PATH = os.path.join(basedir, "static", "fonts", "Montserrat-Regular.ttf")
+FONTS_DIR = os.path.join(basedir, "static", "fonts")
+FONT_PATH = os.path.join(FONTS_DIR, "Montserrat-Regular.ttf")
+DEFAULT_INVITE_FONT = 'Montserrat-Regular'
+ALLOWED_INVITE_FONTS = ['Birthstone-Regular', 'Ephesis-Regular', 'Montserrat-Regular', 'Radley-Regular', 'BebasNeue-Regular', 'Cinzel-Regular', 'JosefinSans-Regular']
 BRASILIA_TZ = pytz.timezone('America/Sao_Paulo')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -114,6 +146,9 @@ if not os.path.exists(PARTY_LOGOS_SAVE_PATH):
 if not os.path.exists(PAYMENT_QRCODES_SAVE_PATH):
     os.makedirs(PAYMENT_QRCODES_SAVE_PATH)
     print(f"Criada pasta para QR Codes de pagamento: {PAYMENT_QRCODES_SAVE_PATH}")
+if not os.path.exists(INVITE_CARDS_CACHE_PATH):
+    os.makedirs(INVITE_CARDS_CACHE_PATH)
+    print(f"Criada pasta para cache de convites: {INVITE_CARDS_CACHE_PATH}")
 
 # A pasta 'instance' no diretório do projeto agora é opcional,
 # já que o banco de dados não está mais lá. Se ela não for usada para mais nada, pode ser removida.
@@ -184,7 +219,9 @@ def delete_pix_qr_code_file(guest):
 # NENHUMA ALTERAÇÃO NECESSÁRIA AQUI. SQLAlchemy cuida da tradução para o dialeto do PostgreSQL.
 party_collaborators = db.Table('party_collaborators',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('party_id', db.Integer, db.ForeignKey('party.id'), primary_key=True)
+    db.Column('party_id', db.Integer, db.ForeignKey('party.id'), primary_key=True),
+    # A chave primária (user_id, party_id) já serve as colaborações de um usuário; este, os colaboradores da festa
+    db.Index('ix_party_collaborators_party_id', 'party_id')
 )
 
 class User(UserMixin, db.Model):
@@ -209,7 +246,10 @@ class Party(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(BRASILIA_TZ))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     guests = db.relationship('Guest', backref='party', lazy=True, cascade="all, delete-orphan")
+    check_in_events = db.relationship('CheckInEvent', backref='party', lazy=True, cascade="all, delete-orphan")
     logo_filename = db.Column(db.String(255), nullable=True)
+    logo_card_filename = db.Column(db.String(255), nullable=True)
+    logo_palette = db.Column(db.JSON, nullable=True)
     shareable_link_id = db.Column(db.String(16), unique=True, nullable=False)
     public_description = db.Column(db.Text, nullable=True)
     show_guest_count = db.Column(db.Boolean, nullable=False, default=True)
@@ -220,6 +260,17 @@ class Party(db.Model):
     event_date = db.Column(db.Date, nullable=True)
     event_time = db.Column(db.Time, nullable=True)
     invite_font = db.Column(db.String(100), nullable=False, default='Montserrat-Regular')
+    # Avança a cada alteração nos convidados (ver bump_party_version); guests_removed_version guarda a
+    # última versão em que convidados sumiram ou mudaram todos de uma vez (exige manifesto completo).
+    version = db.Column(db.Integer, nullable=False, default=0)
+    guests_removed_version = db.Column(db.Integer, nullable=False, default=0)
+    # Contadores materializados dos convidados, atualizados junto com a versão (ver bump_party_version)
+    # na mesma transação de cada alteração; reconcile_party_counters os refaz do zero.
+    guest_count = db.Column(db.Integer, nullable=False, default=0)
+    entered_count = db.Column(db.Integer, nullable=False, default=0)
+    paid_count = db.Column(db.Integer, nullable=False, default=0)
+    paid_revenue = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (db.Index('ix_party_user_id', 'user_id'),) # festas do usuário no painel
 
     @property
     def formatted_date(self):
@@ -252,6 +303,21 @@ class Guest(db.Model):
     purchased_by_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     purchaser = db.relationship('User', foreign_keys=[purchased_by_user_id], backref='purchased_tickets')
     purchase_price = db.Column(db.Float, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=0) # versão da festa na última alteração
+    # Nome sem acentos e em minúsculas (ver normalize_search_text), mantido no flush, para a busca
+    search_name = db.Column(db.String(100), nullable=False, default='')
+    __table_args__ = (
+        # Trigramas no PostgreSQL atendem o LIKE '%termo%'; nos outros bancos vira um índice comum
+        db.Index('ix_guest_search_name_trgm', 'search_name', postgresql_using='gin', postgresql_ops={'search_name': 'gin_trgm_ops'}),
+        # Uma por ordenação da lista (o id desempata e serve a paginação por cursor); o de nome atende
+        # também a geração de convites e as buscas só por festa, e o de check_in_time, o gráfico de entradas
+        db.Index('ix_guest_party_id_name', 'party_id', 'name', 'id'),
+        db.Index('ix_guest_party_id_check_in_time', 'party_id', 'check_in_time', 'id'),
+        db.Index('ix_guest_party_id_payment_status', 'party_id', 'payment_status', 'id'),
+        db.Index('ix_guest_party_id_entered', 'party_id', 'entered', 'id'),
+        db.Index('ix_guest_party_id_version', 'party_id', 'version'), # delta do manifesto do scanner
+        db.Index('ix_guest_purchased_by_user_id', 'purchased_by_user_id', 'id'), # "Meus ingressos" e compras
+    )
 
     @property
     def qr_image_url(self):
@@ -266,9 +332,309 @@ class Guest(db.Model):
         return None
 
     def get_check_in_time_str(self):
-        if self.check_in_time:
-            return self.check_in_time.astimezone(BRASILIA_TZ).strftime('%d/%m/%Y %H:%M:%S')
-        return "N/A"
+        return format_check_in_time(self.check_in_time)
+
+# Histórico imutável das entradas: o convidado guarda só o estado atual (entered/check_in_time), os
+# eventos guardam cada leitura que liberou a entrada, cada horário corrigido na sincronização offline
+# e cada alteração manual, com aparelho e horário.
+CHECK_IN_EVENT_ENTRY, CHECK_IN_EVENT_MANUAL_ENTRY, CHECK_IN_EVENT_MANUAL_EXIT = 'entry', 'manual_entry', 'manual_exit'
+CHECK_IN_EVENT_ENTRY_CORRECTED = 'entry_corrected' # leitura offline mais antiga virou o horário da entrada
+
+class CheckInEvent(db.Model):
+    __tablename__ = 'check_in_event'
+    id = db.Column(db.Integer, primary_key=True)
+    party_id = db.Column(db.Integer, db.ForeignKey('party.id'), nullable=False)
+    guest_id = db.Column(db.Integer, db.ForeignKey('guest.id', ondelete='SET NULL'), nullable=True)
+    kind = db.Column(db.String(20), nullable=False)
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    previous_occurred_at = db.Column(db.DateTime, nullable=True) # em entry_corrected, o horário substituído
+    device = db.Column(db.String(64), nullable=True) # portaria/aparelho que fez a leitura
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) # quem fez a alteração manual
+    version = db.Column(db.Integer, nullable=False, default=0) # versão da festa em que o evento entrou
+
+    __table_args__ = (db.Index('ix_check_in_event_party_id_version', 'party_id', 'version'),)
+
+def normalize_search_text(text):
+    """Forma usada na busca por nome: sem acentos, em minúsculas e com espaços simples ("José " -> "jose")."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().split())
+
+def format_check_in_time(check_in_time):
+    if check_in_time:
+        return check_in_time.astimezone(BRASILIA_TZ).strftime('%d/%m/%Y %H:%M:%S')
+    return "N/A"
+
+# --- Versão dos Dados da Festa ---
+# Cada alteração de convidado avança party.version e grava essa versão no convidado, o que permite
+# aos scanners offline buscar só o que mudou desde a última sincronização. O UPDATE na linha da festa
+# serializa as transações que alteram a mesma festa, então as versões seguem a ordem dos commits.
+PARTY_COUNTER_COLUMNS = ('guest_count', 'entered_count', 'paid_count', 'paid_revenue')
+
+def guest_counter_values(entered, payment_status, purchase_price):
+    """Quanto um convidado soma em cada um dos PARTY_COUNTER_COLUMNS."""
+    paid = payment_status == 'paid'
+    return (1, 1 if entered else 0, 1 if paid else 0, (purchase_price or 0.0) if paid else 0.0)
+
+def bump_party_version(connection, party_id, guests_removed=False, counters=None):
+    """Avança a versão da festa e aplica as variações dos contadores ({coluna: delta}) no mesmo UPDATE."""
+    values = {'version': Party.version + 1}
+    if guests_removed:
+        values['guests_removed_version'] = Party.version + 1
+    for column, delta in (counters or {}).items():
+        if delta:
+            values[column] = getattr(Party, column) + delta
+    return connection.execute(
+        db.update(Party).where(Party.id == party_id).values(**values).returning(Party.version)
+    ).scalar()
+
+# --- Ingressos Assinados ---
+# Com SIGNED_QR_TICKETS=true, o QR dos convites passa a levar "T1.<festa>.<convidado>.<assinatura>":
+# ids em base 36 e HMAC-SHA256 (chave SECRET_KEY) truncado em base32, tudo em maiúsculas para usar o
+# modo alfanumérico do QR, mais compacto. A leitura de um QR assinado é validada sem consultar o
+# banco e QRs do formato antigo (só o qr_hash) continuam aceitos.
+SIGNED_QR_TICKETS = os.environ.get('SIGNED_QR_TICKETS', 'False').lower() == 'true'
+SIGNED_TICKET_PREFIX = 'T1'
+SIGNED_TICKET_MAC_BYTES = 10
+BASE36_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+QR_HASH_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+def to_base36(number):
+    encoded = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = BASE36_DIGITS[remainder] + encoded
+        if number == 0:
+            return encoded
+
+def signed_ticket_mac(party_id, guest_id):
+    message = f"{SIGNED_TICKET_PREFIX}.{party_id}.{guest_id}".encode('utf-8')
+    digest = hmac.new(app.config['SECRET_KEY'].encode('utf-8'), message, hashlib.sha256).digest()
+    return base64.b32encode(digest[:SIGNED_TICKET_MAC_BYTES]).decode('ascii').rstrip('=')
+
+def make_signed_ticket(party_id, guest_id):
+    return f"{SIGNED_TICKET_PREFIX}.{to_base36(party_id)}.{to_base36(guest_id)}.{signed_ticket_mac(party_id, guest_id)}"
+
+def guest_qr_data(party_id, guest_id, qr_hash):
+    """Conteúdo do QR Code do convite: o ingresso assinado, se habilitado, ou o qr_hash."""
+    return make_signed_ticket(party_id, guest_id) if SIGNED_QR_TICKETS else qr_hash
+
+def parse_ticket(code, party_id):
+    """
+    Interpreta o conteúdo lido do QR, sem consultar o banco. Retorna ('guest_id', id) para um ingresso
+    assinado válido desta festa, ('qr_hash', qr_hash) para o formato antigo, ou None para códigos
+    forjados, de outra festa ou que não são ingressos.
+    """
+    code = (code or '').strip()
+    if code.upper().startswith(f"{SIGNED_TICKET_PREFIX}."):
+        parts = code.upper().split('.')
+        if len(parts) != 4:
+            return None
+        try:
+            ticket_party_id, guest_id = int(parts[1], 36), int(parts[2], 36)
+        except ValueError:
+            return None
+        if ticket_party_id != party_id or not hmac.compare_digest(parts[3], signed_ticket_mac(ticket_party_id, guest_id)):
+            return None
+        return 'guest_id', guest_id
+    if QR_HASH_PATTERN.fullmatch(code):
+        return 'qr_hash', code
+    return None
+
+def ticket_filter(ticket):
+    kind, value = ticket
+    return Guest.id == value if kind == 'guest_id' else Guest.qr_hash == value
+
+@event.listens_for(Session, 'before_flush')
+def bump_party_versions_on_flush(session, flush_context, instances):
+    """
+    Alterações de convidados feitas pelo ORM (cadastro, edição, pagamento, remoção) avançam a versão
+    e os contadores da festa; eventos de check-in novos recebem a versão da alteração que registram.
+    """
+    changed_guests, full_refresh, counter_deltas = {}, set(), {}
+    replaced_guests, removed_guests = [], []
+
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Guest) and db.inspect(obj).attrs.name.history.has_changes():
+            obj.search_name = normalize_search_text(obj.name)
+
+    def add_counters(party_id, values, sign):
+        deltas = counter_deltas.setdefault(party_id, [0] * len(PARTY_COUNTER_COLUMNS))
+        for i, value in enumerate(values):
+            deltas[i] += sign * value
+
+    for obj in session.new:
+        if isinstance(obj, (Guest, CheckInEvent)):
+            changed_guests.setdefault(obj.party_id, []).append(obj)
+        if isinstance(obj, Guest):
+            add_counters(obj.party_id, guest_counter_values(obj.entered, obj.payment_status or 'not_applicable', obj.purchase_price), 1)
+    for obj in session.dirty:
+        if isinstance(obj, Guest) and session.is_modified(obj, include_collections=False):
+            changed_guests.setdefault(obj.party_id, []).append(obj)
+            attrs = db.inspect(obj).attrs
+            if any(getattr(attrs, name).history.has_changes() for name in ('entered', 'payment_status', 'purchase_price')):
+                replaced_guests.append(obj)
+        elif isinstance(obj, Party) and db.inspect(obj).attrs.ticket_price.history.has_changes():
+            full_refresh.add(obj.id) # o preço muda quem pode entrar
+    for obj in session.deleted:
+        if isinstance(obj, Guest):
+            full_refresh.add(obj.party_id)
+            removed_guests.append(obj)
+
+    if replaced_guests or removed_guests:
+        # O que cada convidado somava vem do banco (ainda sem este flush); o FOR UPDATE faz uma
+        # alteração concorrente do mesmo convidado esperar e descontar o valor já confirmado.
+        previous = session.execute(
+            db.select(Guest.id, Guest.party_id, Guest.entered, Guest.payment_status, Guest.purchase_price)
+            .where(Guest.id.in_([obj.id for obj in replaced_guests + removed_guests]))
+            .with_for_update()
+        )
+        for row in previous:
+            add_counters(row.party_id, guest_counter_values(row.entered, row.payment_status, row.purchase_price), -1)
+        for obj in replaced_guests:
+            add_counters(obj.party_id, guest_counter_values(obj.entered, obj.payment_status, obj.purchase_price), 1)
+
+    for party_id in (set(changed_guests) | full_refresh) - {None}:
+        counters = dict(zip(PARTY_COUNTER_COLUMNS, counter_deltas.get(party_id, ())))
+        version = bump_party_version(session.connection(), party_id, guests_removed=party_id in full_refresh, counters=counters)
+        for guest in changed_guests.get(party_id, []):
+            guest.version = version
+
+# --- Eventos ao Vivo da Festa ---
+# As telas de gerenciamento assinam /api/party/<id>/events (Server-Sent Events) e aplicam cada evento
+# (check_in, guest_added, guest_updated, guest_deleted, payment_status) sem refazer a lista inteira.
+# No PostgreSQL os eventos saem por NOTIFY, que só é entregue no commit e chega a todos os workers
+# (cada processo com assinantes mantém uma conexão em LISTEN); nos outros bancos a entrega fica
+# restrita ao próprio processo.
+PARTY_EVENTS_CHANNEL = 'party_events'
+PARTY_EVENTS_MAX_PAYLOAD = 7000 # O limite do NOTIFY é 8000 bytes
+PARTY_EVENTS_QUEUE_SIZE = 1000
+PARTY_EVENTS_KEEPALIVE_SECONDS = 15
+PARTY_EVENTS_RECONNECT_SECONDS = 5
+PARTY_EVENTS_RESYNC = json.dumps([{'type': 'resync'}])
+
+class PartyEventBroker:
+    """Entrega as mensagens recebidas pelo processo às conexões SSE abertas, por festa."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, party_id, engine):
+        subscriber = queue.Queue(maxsize=PARTY_EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(party_id, set()).add(subscriber)
+            if engine.dialect.name == 'postgresql' and (self._listener is None or not self._listener.is_alive()):
+                self._listener = threading.Thread(target=self._listen, args=(engine,), name='party-events', daemon=True)
+                self._listener.start()
+        return subscriber
+
+    def unsubscribe(self, party_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(party_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[party_id]
+
+    def dispatch(self, party_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(party_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Conexão que não está consumindo: descarta o atraso e pede para a página recarregar tudo
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(PARTY_EVENTS_RESYNC)
+
+    def _listen(self, engine):
+        while True:
+            connection = None
+            try:
+                connection = engine.raw_connection()
+                connection.detach() # Conexão dedicada, fora do pool
+                driver_connection = connection.driver_connection
+                driver_connection.autocommit = True
+                with driver_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {PARTY_EVENTS_CHANNEL}")
+                while True:
+                    if select.select([driver_connection], [], [], PARTY_EVENTS_KEEPALIVE_SECONDS) == ([], [], []):
+                        continue
+                    driver_connection.poll()
+                    while driver_connection.notifies:
+                        party_id, _, message = driver_connection.notifies.pop(0).payload.partition(':')
+                        self.dispatch(int(party_id), message)
+            except Exception:
+                app.logger.exception("Conexão de eventos ao vivo caiu. Reconectando.")
+                time.sleep(PARTY_EVENTS_RECONNECT_SECONDS)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+party_event_broker = PartyEventBroker()
+
+def guest_event(event_type, guest):
+    """Evento com os campos do convidado que as telas atualizam no lugar."""
+    return {
+        'type': event_type, 'id': guest.id, 'qr_hash': guest.qr_hash, 'name': guest.name, 'entered': guest.entered,
+        'check_in_time': format_check_in_time(guest.check_in_time), 'payment_status': guest.payment_status
+    }
+
+def publish_party_events(session, party_id, events):
+    """Publica os eventos junto com a transação da sessão: só são entregues se ela for confirmada."""
+    messages, chunk = [], []
+    for item in events:
+        chunk.append(item)
+        if len(json.dumps(chunk)) > PARTY_EVENTS_MAX_PAYLOAD and len(chunk) > 1:
+            messages.append(json.dumps(chunk[:-1], separators=(',', ':')))
+            chunk = chunk[-1:]
+    if chunk:
+        messages.append(json.dumps(chunk, separators=(',', ':')))
+
+    if session.get_bind().dialect.name == 'postgresql':
+        for message in messages:
+            session.connection().execute(db.select(db.func.pg_notify(PARTY_EVENTS_CHANNEL, f"{party_id}:{message}")))
+    else:
+        session.info.setdefault('party_events', []).extend((party_id, message) for message in messages)
+
+@event.listens_for(Session, 'after_flush')
+def publish_guest_changes_on_flush(session, flush_context):
+    """Alterações de convidados feitas pelo ORM viram eventos ao vivo (as em lote publicam por conta própria)."""
+    events = {}
+    for obj in session.new:
+        if isinstance(obj, Guest):
+            events.setdefault(obj.party_id, []).append(guest_event('guest_added', obj))
+    for obj in session.dirty:
+        if not isinstance(obj, Guest):
+            continue
+        attrs = db.inspect(obj).attrs
+        if attrs.entered.history.has_changes() or attrs.check_in_time.history.has_changes():
+            events.setdefault(obj.party_id, []).append(guest_event('check_in', obj))
+        elif attrs.payment_status.history.has_changes():
+            events.setdefault(obj.party_id, []).append(guest_event('payment_status', obj))
+        elif attrs.name.history.has_changes():
+            events.setdefault(obj.party_id, []).append(guest_event('guest_updated', obj))
+    for obj in session.deleted:
+        if isinstance(obj, Guest):
+            events.setdefault(obj.party_id, []).append({'type': 'guest_deleted', 'id': obj.id, 'qr_hash': obj.qr_hash, 'entered': obj.entered})
+    for party_id, party_events in events.items():
+        if party_id is None:
+            continue
+        if any(item['type'] == 'check_in' for item in party_events):
+            # Contadores absolutos: as telas não acumulam erro somando entradas uma a uma
+            party_events[-1]['counters'] = get_party_counters(party_id)
+        publish_party_events(session, party_id, party_events)
+
+@event.listens_for(Session, 'after_commit')
+def deliver_local_party_events(session):
+    for party_id, message in session.info.pop('party_events', []):
+        party_event_broker.dispatch(party_id, message)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_local_party_events(session):
+    session.info.pop('party_events', None)
 
 
 
@@ -283,113 +649,548 @@ def load_user(user_id):
 def get_vibrant_colors(pil_img, num_colors=2):
     img = pil_img.copy().convert("RGBA")
     img.thumbnail((100, 100))
-    all_colors = img.getcolors(img.size[0] * img.size[1])
+    total_pixels = img.size[0] * img.size[1]
+    all_colors = img.getcolors(total_pixels)
     if not all_colors: return []
-    vibrant_candidates = []
-    for count, rgba in all_colors:
-        r, g, b, a = rgba
-        if a < 128: continue
-        h, s, v = colorsys.rgb_to_hsv(r / 255.0, g / 255.0, b / 255.0)
-        if s > 0.35 and 0.3 < v < 0.95:
-            score = (s * 0.8) + (count / (img.size[0] * img.size[1]) * 0.2)
-            vibrant_candidates.append({'color': (r, g, b), 'score': score})
-    if not vibrant_candidates: return []
-    vibrant_candidates.sort(key=lambda x: x['score'], reverse=True)
-    return [c['color'] for c in vibrant_candidates[:num_colors]]
 
-def generate_qr_code_image(qr_data, guest_name, party, output_format='PNG', font_override=None):
+    # Pontua todas as cores distintas de uma vez (mesma fórmula HSV do colorsys.rgb_to_hsv).
+    counts = np.fromiter((count for count, _ in all_colors), dtype=np.float64, count=len(all_colors))
+    rgba = np.array([color for _, color in all_colors], dtype=np.uint8).reshape(-1, 4)
+    rgb = rgba[:, :3] / 255.0
+    max_c, min_c = rgb.max(axis=1), rgb.min(axis=1)
+    saturation = np.divide(max_c - min_c, max_c, out=np.zeros_like(max_c), where=max_c != min_c)
+    value = max_c
+
+    candidates = (rgba[:, 3] >= 128) & (saturation > 0.35) & (value > 0.3) & (value < 0.95)
+    if not candidates.any(): return []
+    scores = (saturation[candidates] * 0.8) + (counts[candidates] / total_pixels * 0.2)
+    # Ordenação estável para manter o desempate na ordem de getcolors(), como antes
+    order = np.argsort(-scores, kind='stable')[:num_colors]
+    return [tuple(color) for color in rgba[candidates][order, :3].tolist()]
+
+def draw_vertical_gradient(width, height, start_color, end_color):
+    """Cria uma imagem RGB com gradiente vertical (linha y usa a proporção y / height)."""
+    ratio = (np.arange(height, dtype=np.float64) / height)[:, None]
+    rows = (np.array(start_color, dtype=np.float64) * (1 - ratio) + np.array(end_color, dtype=np.float64) * ratio).astype(np.uint8)
+    # Uma coluna de 1px esticada com NEAREST replica cada linha sem percorrer pixel a pixel
+    return Image.fromarray(rows[:, None, :]).resize((width, height), Image.Resampling.NEAREST)
+
+# --- Registro de Fontes ---
+# Cada (fonte, tamanho) é carregada uma única vez por worker e compartilhada entre renderizações.
+INVITE_FONT_SIZES = (52, 36, 14)
+_invite_fonts = {}
+_invite_fonts_lock = threading.Lock()
+
+def resolve_invite_font_name(font_name):
+    """Garante que só fontes da lista permitida sejam usadas (o nome vira caminho de arquivo)."""
+    if font_name in ALLOWED_INVITE_FONTS:
+        return font_name
+    if font_name:
+        app.logger.warning(f"Fonte {font_name} não permitida. Usando {DEFAULT_INVITE_FONT}.")
+    return DEFAULT_INVITE_FONT
+
+def get_invite_font(font_name, size):
+    font_name = resolve_invite_font_name(font_name)
+    key = (font_name, size)
+    font = _invite_fonts.get(key)
+    if font is not None:
+        return font
+    with _invite_fonts_lock:
+        font = _invite_fonts.get(key)
+        if font is None:
+            font_path = os.path.join(FONTS_DIR, f"{font_name}.ttf")
+            try:
+                font = PILImageFont.truetype(font_path, size)
+            except IOError:
+                app.logger.warning(f"Fonte personalizada {font_name} não encontrada. Usando fonte padrão.")
+                font = PILImageFont.load_default(size)
+            _invite_fonts[key] = font
+    return font
+
+def warm_invite_fonts():
+    for font_name in ALLOWED_INVITE_FONTS:
+        for size in INVITE_FONT_SIZES:
+            get_invite_font(font_name, size)
+
+if os.environ.get('WARM_INVITE_FONTS', 'False').lower() == 'true':
+    warm_invite_fonts()
+
+# --- Templates de Convite por Festa ---
+# Tudo o que não depende do convidado (fontes, cores do logo, logo recortado, gradiente,
+# nome da festa e rodapé) é montado uma vez por festa e reaproveitado; cada convite só
+# cola o QR Code e escreve o nome do convidado.
+CARD_WIDTH, CARD_PADDING, CARD_SPACING, CARD_LOGO_ASPECT_RATIO = 600, 40, 25, 2 / 1
+CARD_BG_COLOR, CARD_TEXT_COLOR, CARD_FOOTER_COLOR = (255, 255, 255, 235), (15, 23, 42), (100, 116, 139)
+CARD_FOOTER_TEXT = "Feito com QRPass"
+CARD_STYLE_CACHE_SIZE, CARD_TEMPLATE_CACHE_SIZE = 64, 32
+
+_card_styles = OrderedDict()
+_card_templates = OrderedDict()
+_card_cache_lock = threading.Lock()
+
+def _lru_get_or_build(cache, key, max_items, builder):
+    with _card_cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            return value
+    value = builder()
+    with _card_cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_items:
+            cache.popitem(last=False)
+    return value
+
+# --- Ingestão do Logo da Festa ---
+# O upload é decodificado uma única vez: fica gravada uma cópia normalizada (primeiro quadro,
+# orientação corrigida, tamanho limitado) para exibição, o logo já recortado na caixa do
+# convite e a paleta extraída. A renderização dos convites só lê o recorte pequeno.
+CARD_LOGO_SIZE = (CARD_WIDTH, int(CARD_WIDTH / CARD_LOGO_ASPECT_RATIO))
+LOGO_DISPLAY_MAX_SIZE = (1200, 1200)
+
+def remove_party_logo_files(party):
+    for filename in (party.logo_filename, party.logo_card_filename):
+        if filename:
+            try: os.remove(os.path.join(PARTY_LOGOS_SAVE_PATH, filename))
+            except OSError: pass
+
+def ingest_party_logo(stream, party_id):
+    """Normaliza o logo enviado. Retorna (logo_filename, logo_card_filename, paleta)."""
+    with Image.open(stream) as uploaded:
+        uploaded.seek(0) # GIFs animados: apenas o primeiro quadro
+        logo = ImageOps.exif_transpose(uploaded).convert("RGBA")
+
     try:
-        CARD_WIDTH, PADDING, SPACING, LOGO_ASPECT_RATIO = 600, 40, 25, 2 / 1
-        GRADIENT_START, GRADIENT_END = (15, 23, 42), (59, 130, 246)
-        CARD_BG_COLOR, TEXT_COLOR, FOOTER_COLOR = (255, 255, 255, 235), (15, 23, 42), (100, 116, 139)
-        GUEST_NAME_COLOR = (37, 99, 235)
+        palette = [list(color) for color in get_vibrant_colors(logo, num_colors=2)]
+    except Exception as e:
+        app.logger.warning(f"Não foi possível extrair cores: {e}.")
+        palette = []
+    logo_card = ImageOps.fit(logo, CARD_LOGO_SIZE, Image.Resampling.LANCZOS)
+    logo.thumbnail(LOGO_DISPLAY_MAX_SIZE, Image.Resampling.LANCZOS)
+
+    base_name = f"{party_id}_{uuid.uuid4().hex}"
+    card_filename = f"{base_name}_card.png"
+    logo_card.save(os.path.join(PARTY_LOGOS_SAVE_PATH, card_filename), format='PNG')
+    if logo.getextrema()[3][0] < 255:
+        display_filename = f"{base_name}.png"
+        logo.save(os.path.join(PARTY_LOGOS_SAVE_PATH, display_filename), format='PNG', optimize=True)
+    else:
+        display_filename = f"{base_name}.jpg"
+        logo.convert("RGB").save(os.path.join(PARTY_LOGOS_SAVE_PATH, display_filename), format='JPEG', quality=90)
+    return display_filename, card_filename, palette
+
+def load_party_card_logo(party):
+    """Retorna (logo recortado, paleta) da festa, ou (None, []) se ela não tiver logo."""
+    if party.logo_card_filename:
+        card_path = os.path.join(PARTY_LOGOS_SAVE_PATH, party.logo_card_filename)
+        if os.path.exists(card_path):
+            with Image.open(card_path) as logo_card:
+                return logo_card.convert("RGBA"), [tuple(color) for color in party.logo_palette or []]
+    # Logos enviados antes da ingestão: decodifica o arquivo original
+    if party.logo_filename:
+        logo_path = os.path.join(PARTY_LOGOS_SAVE_PATH, party.logo_filename)
+        if os.path.exists(logo_path):
+            logo_img_raw = Image.open(logo_path).convert("RGBA")
+            try:
+                vibrant_colors = get_vibrant_colors(logo_img_raw, num_colors=2)
+            except Exception as e:
+                app.logger.warning(f"Não foi possível extrair cores: {e}.")
+                vibrant_colors = []
+            return ImageOps.fit(logo_img_raw, CARD_LOGO_SIZE, Image.Resampling.LANCZOS), vibrant_colors
+    return None, []
+
+def _build_party_card_style(party, font_name):
+    gradient_start, gradient_end = (15, 23, 42), (59, 130, 246)
+    guest_name_color = (37, 99, 235)
+
+    font_party_name = get_invite_font(font_name, 52)
+    font_guest_name = get_invite_font(font_name, 36)
+    font_footer = get_invite_font(DEFAULT_INVITE_FONT, 14) # Footer always Montserrat
+
+    logo_mask, logo_height = None, 0
+    logo_fitted, vibrant_colors = load_party_card_logo(party)
+    if logo_fitted is not None:
+        logo_height = logo_fitted.size[1]
+        if len(vibrant_colors) >= 1:
+            main_color = vibrant_colors[0]
+            guest_name_color, gradient_end = main_color, main_color
+            gradient_start = tuple(int(c * 0.5) for c in main_color)
+        logo_mask = Image.new('L', logo_fitted.size, 0)
+        mask_draw = ImageDraw.Draw(logo_mask)
+        mask_draw.rounded_rectangle((0, 0, *logo_fitted.size), radius=30, fill=255)
+        mask_draw.rectangle((0, 30, *logo_fitted.size), fill=255)
 
-        try:
-            # Use a fonte selecionada para a festa
-            selected_font_name = font_override if font_override else (party.invite_font if party.invite_font else 'Montserrat-Regular')
-            font_path = os.path.join(basedir, 'static', 'fonts', f"{selected_font_name}.ttf")
-            
-            app.logger.info(f"Attempting to load font from: {font_path}")
-
-            font_party_name = PILImageFont.truetype(font_path, 52)
-            font_guest_name = PILImageFont.truetype(font_path, 36)
-            font_footer = PILImageFont.truetype(os.path.join(basedir, "static", "fonts", "Montserrat-Regular.ttf"), 14) # Footer always Montserrat
-        except IOError:
-            app.logger.warning(f"Fonte personalizada {selected_font_name} não encontrada. Usando fonte padrão.")
-            font_party_name, font_guest_name, font_footer = (PILImageFont.load_default(s) for s in [52,36,14])
-
-        logo_img_raw, logo_height = None, 0
-        if party.logo_filename:
-            logo_path = os.path.join(PARTY_LOGOS_SAVE_PATH, party.logo_filename)
-            if os.path.exists(logo_path):
-                logo_height = int(CARD_WIDTH / LOGO_ASPECT_RATIO)
-                logo_img_raw = Image.open(logo_path).convert("RGBA")
-                try:
-                    vibrant_colors = get_vibrant_colors(logo_img_raw, num_colors=2)
-                    if len(vibrant_colors) >= 1:
-                        main_color = vibrant_colors[0]
-                        GUEST_NAME_COLOR, GRADIENT_END = main_color, main_color
-                        GRADIENT_START = tuple(int(c * 0.5) for c in main_color)
-                except Exception as e:
-                    app.logger.warning(f"Não foi possível extrair cores: {e}.")
-
-        qr_instance = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=8, border=2)
-        qr_instance.add_data(qr_data)
-        qr_instance.make(fit=True)
-        img_qr = qr_instance.make_image(fill_color="black", back_color="white").convert('RGB')
-
-        content_height = PADDING + font_party_name.getbbox(party.name)[3] + SPACING + img_qr.size[0] + SPACING + font_guest_name.getbbox(guest_name)[3] + SPACING + font_footer.getbbox("Feito com QRPass")[3] + PADDING
-        card_height = logo_height + content_height
-        canvas_height, canvas_width = card_height + PADDING * 2, CARD_WIDTH + PADDING * 2
-
-        canvas = Image.new('RGB', (canvas_width, canvas_height), GRADIENT_START)
-        draw = ImageDraw.Draw(canvas)
-        for y in range(canvas_height):
-            ratio = y / canvas_height
-            color_tuple = tuple(int(start * (1 - ratio) + end * ratio) for start, end in zip(GRADIENT_START, GRADIENT_END))
-            draw.line([(0, y), (canvas_width, y)], fill=color_tuple)
-
-        card_img = Image.new('RGBA', (CARD_WIDTH, card_height), (0,0,0,0))
-        ImageDraw.Draw(card_img).rounded_rectangle((0, 0, CARD_WIDTH, card_height), radius=30, fill=CARD_BG_COLOR)
-
-        if logo_img_raw:
-            logo_fitted = ImageOps.fit(logo_img_raw, (CARD_WIDTH, logo_height), Image.Resampling.LANCZOS)
-            mask = Image.new('L', logo_fitted.size, 0)
-            mask_draw = ImageDraw.Draw(mask)
-            mask_draw.rounded_rectangle((0, 0, *logo_fitted.size), radius=30, fill=255)
-            mask_draw.rectangle((0, 30, *logo_fitted.size), fill=255)
-            card_img.paste(logo_fitted, (0, 0), mask)
-
-        content_draw = ImageDraw.Draw(card_img)
-        current_y = logo_height + PADDING
-        items = [(party.name, font_party_name, TEXT_COLOR), (img_qr, None, None), (guest_name, font_guest_name, GUEST_NAME_COLOR), ("Feito com QRPass", font_footer, FOOTER_COLOR)]
-        for item, font, color in items:
-            if isinstance(item, Image.Image):
-                card_img.paste(item, ((CARD_WIDTH - item.width) // 2, int(current_y)))
-                current_y += item.height + SPACING
-            else:
-                bbox = content_draw.textbbox((0, 0), item, font=font)
-                content_draw.text(((CARD_WIDTH - bbox[2]) / 2, current_y), item, font=font, fill=color)
-                current_y += bbox[3] + SPACING
+    return {
+        'font_party_name': font_party_name, 'font_guest_name': font_guest_name, 'font_footer': font_footer,
+        'gradient_start': gradient_start, 'gradient_end': gradient_end, 'guest_name_color': guest_name_color,
+        'logo_fitted': logo_fitted, 'logo_mask': logo_mask, 'logo_height': logo_height,
+    }
 
-        canvas.paste(card_img, ((canvas_width - CARD_WIDTH) // 2, (canvas_height - card_height) // 2), card_img)
+def _build_party_card_template(style, party_name, qr_size, guest_name_height):
+    font_party_name, font_footer = style['font_party_name'], style['font_footer']
+    logo_height = style['logo_height']
+    party_name_height = font_party_name.getbbox(party_name)[3]
+    footer_height = font_footer.getbbox(CARD_FOOTER_TEXT)[3]
+
+    content_height = CARD_PADDING + party_name_height + CARD_SPACING + qr_size + CARD_SPACING + guest_name_height + CARD_SPACING + footer_height + CARD_PADDING
+    card_height = logo_height + content_height
+    canvas_height, canvas_width = card_height + CARD_PADDING * 2, CARD_WIDTH + CARD_PADDING * 2
+
+    canvas = draw_vertical_gradient(canvas_width, canvas_height, style['gradient_start'], style['gradient_end'])
+
+    card_img = Image.new('RGBA', (CARD_WIDTH, card_height), (0,0,0,0))
+    ImageDraw.Draw(card_img).rounded_rectangle((0, 0, CARD_WIDTH, card_height), radius=30, fill=CARD_BG_COLOR)
+    if style['logo_fitted']:
+        card_img.paste(style['logo_fitted'], (0, 0), style['logo_mask'])
+
+    content_draw = ImageDraw.Draw(card_img)
+    current_y = logo_height + CARD_PADDING
+    bbox = content_draw.textbbox((0, 0), party_name, font=font_party_name)
+    content_draw.text(((CARD_WIDTH - bbox[2]) / 2, current_y), party_name, font=font_party_name, fill=CARD_TEXT_COLOR)
+    current_y += bbox[3] + CARD_SPACING
+    qr_y = int(current_y)
+    current_y += qr_size + CARD_SPACING
+    guest_name_y = current_y
+    current_y += guest_name_height + CARD_SPACING
+    bbox = content_draw.textbbox((0, 0), CARD_FOOTER_TEXT, font=font_footer)
+    content_draw.text(((CARD_WIDTH - bbox[2]) / 2, current_y), CARD_FOOTER_TEXT, font=font_footer, fill=CARD_FOOTER_COLOR)
+
+    card_x, card_y = (canvas_width - CARD_WIDTH) // 2, (canvas_height - card_height) // 2
+    # A faixa do nome do convidado guarda a camada do cartão (translúcida) e o gradiente por trás dela:
+    # o nome é escrito na camada e composto como no cartão inteiro, cortado na borda do cartão.
+    name_box = (card_x, card_y + guest_name_y, card_x + CARD_WIDTH, card_y + guest_name_y + guest_name_height)
+    name_backdrop = canvas.crop(name_box)
+    name_layer = card_img.crop((0, guest_name_y, CARD_WIDTH, guest_name_y + guest_name_height))
+    canvas.paste(card_img, (card_x, card_y), card_img)
 
-        img_io = io.BytesIO()
-        canvas.save(img_io, format=output_format)
-        img_io.seek(0)
-        return img_io
+    return {
+        'canvas': canvas,
+        'qr_position': (card_x + (CARD_WIDTH - qr_size) // 2, card_y + qr_y),
+        'name_position': name_box[:2],
+        'name_backdrop': name_backdrop,
+        'name_layer': name_layer,
+    }
+
+def make_guest_qr_image(qr_data):
+    qr_instance = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=8, border=2)
+    qr_instance.add_data(qr_data)
+    qr_instance.make(fit=True)
+    return qr_instance.make_image(fill_color="black", back_color="white").convert('RGB')
+
+def get_party_card_template(party, font_name, qr_size, guest_name_height):
+    """Retorna (style, template) da festa, montando e guardando em cache na primeira vez."""
+    style_key = (party.id, party.logo_filename, font_name)
+    style = _lru_get_or_build(_card_styles, style_key, CARD_STYLE_CACHE_SIZE,
+                              lambda: _build_party_card_style(party, font_name))
+    template_key = (style_key, party.name, qr_size, guest_name_height)
+    template = _lru_get_or_build(_card_templates, template_key, CARD_TEMPLATE_CACHE_SIZE,
+                                 lambda: _build_party_card_template(style, party.name, qr_size, guest_name_height))
+    return style, template
+
+def compose_invite_card(qr_data, guest_name, party, font_override=None):
+    """Monta o convite em memória (imagem PIL), sem codificá-lo."""
+    try:
+        # Use a fonte selecionada para a festa
+        selected_font_name = resolve_invite_font_name(font_override if font_override else party.invite_font)
+        font_guest_name = get_invite_font(selected_font_name, 36)
+        img_qr = make_guest_qr_image(qr_data)
+
+        # O template depende da altura do nome do convidado (acentos/descendentes) e do tamanho do QR,
+        # então há poucas variações por festa.
+        guest_name_height = font_guest_name.getbbox(guest_name)[3]
+        style, template = get_party_card_template(party, selected_font_name, img_qr.size[0], guest_name_height)
+
+        canvas = template['canvas'].copy()
+        canvas.paste(img_qr, template['qr_position'])
+        if guest_name_height > 0:
+            name_layer = template['name_layer'].copy()
+            draw = ImageDraw.Draw(name_layer)
+            bbox = draw.textbbox((0, 0), guest_name, font=font_guest_name)
+            draw.text(((CARD_WIDTH - bbox[2]) / 2, 0), guest_name, font=font_guest_name, fill=style['guest_name_color'])
+            name_strip = template['name_backdrop'].copy()
+            name_strip.paste(name_layer, (0, 0), name_layer)
+            canvas.paste(name_strip, template['name_position'])
+        return canvas
 
     except Exception as e:
         app.logger.error(f"Erro ao gerar imagem do QR Code: {e}")
         return None
 
+def generate_qr_code_image(qr_data, guest_name, party, output_format='PNG', font_override=None):
+    canvas = compose_invite_card(qr_data, guest_name, party, font_override=font_override)
+    if canvas is None:
+        return None
+    img_io = io.BytesIO()
+    canvas.save(img_io, format=output_format)
+    img_io.seek(0)
+    return img_io
+
+# --- Cache de Convites Renderizados ---
+class InviteCardCache:
+    """
+    Cache em dois níveis (LRU em memória + disco em STORAGE_BASE_PATH) dos PNGs de convite.
+    A chave inclui uma impressão digital do conteúdo do cartão, então uma entrada antiga
+    nunca é servida depois que o nome do convidado ou o nome/logo/fonte da festa mudam;
+    a invalidação explícita serve para liberar memória e disco.
+    """
+    def __init__(self, base_path, max_items=256):
+        self.base_path = base_path
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(qr_hash, guest_name, party):
+        raw = '\x1f'.join([qr_hash, guest_name or '', party.name or '', party.logo_filename or '', party.invite_font or ''])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    def _party_dir(self, party_id):
+        return os.path.join(self.base_path, str(party_id))
+
+    def _disk_path(self, party_id, qr_hash, fingerprint, variant):
+        return os.path.join(self._party_dir(party_id), f"{qr_hash}_{fingerprint}_{variant}")
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._items[key] = data
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, party_id, qr_hash, fingerprint, variant='full.png'):
+        key = (party_id, qr_hash, fingerprint, variant)
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                return data
+        try:
+            with open(self._disk_path(*key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def set(self, party_id, qr_hash, fingerprint, data, variant='full.png'):
+        key = (party_id, qr_hash, fingerprint, variant)
+        self._remember(key, data)
+        path = self._disk_path(*key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Escreve em arquivo temporário e renomeia, para outro worker nunca ler um PNG pela metade
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            app.logger.warning(f"Não foi possível gravar o convite em cache ({path}): {e}")
+
+    def invalidate_guest(self, party_id, qr_hash):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == party_id and k[1] == qr_hash]:
+                del self._items[key]
+        for path in glob.glob(os.path.join(self._party_dir(party_id), f"{glob.escape(qr_hash)}_*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate_party(self, party_id):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == party_id]:
+                del self._items[key]
+        shutil.rmtree(self._party_dir(party_id), ignore_errors=True)
+
+invite_card_cache = InviteCardCache(INVITE_CARDS_CACHE_PATH, max_items=INVITE_CARD_CACHE_SIZE)
+
+def get_invite_card_png(qr_hash, guest_name, party, qr_data=None):
+    """
+    Retorna os bytes PNG do convite do convidado, renderizando apenas em caso de cache miss.
+    qr_data é o conteúdo do QR (ver guest_qr_data); por padrão, o próprio qr_hash.
+    """
+    qr_data = qr_data or qr_hash
+    fingerprint = InviteCardCache.fingerprint(qr_data, guest_name, party)
+    png_data = invite_card_cache.get(party.id, qr_hash, fingerprint)
+    if png_data is None:
+        img_buffer = generate_qr_code_image(qr_data, guest_name, party)
+        if not img_buffer:
+            return None
+        png_data = img_buffer.getvalue()
+        invite_card_cache.set(party.id, qr_hash, fingerprint, png_data)
+    return png_data
+
+# --- Variantes do Convite (tamanho e formato) ---
+# Largura máxima em pixels de cada tamanho ('full' mantém o cartão original)
+INVITE_CARD_SIZES = {'full': None, 'medium': 360, 'thumb': 160}
+INVITE_CARD_FORMATS = {'png': 'image/png', 'webp': 'image/webp'}
+
+def negotiate_invite_card_variant(default_size='full'):
+    """
+    Escolhe (tamanho, formato) a partir de ?size= e ?format=; sem ?format=, usa WebP se o
+    cabeçalho Accept pedir explicitamente. O terceiro valor indica se o Accept influenciou a escolha.
+    """
+    size = request.args.get('size', default_size)
+    if size not in INVITE_CARD_SIZES:
+        size = default_size
+    fmt = request.args.get('format', '').lower()
+    if fmt in INVITE_CARD_FORMATS:
+        return size, fmt, False
+    accepts_webp = any(mimetype == 'image/webp' and quality > 0 for mimetype, quality in request.accept_mimetypes)
+    return size, 'webp' if accepts_webp else 'png', True
+
+def convert_invite_card(img, size, fmt):
+    """Codifica a variante a partir do convite em tamanho cheio (imagem PIL)."""
+    width = INVITE_CARD_SIZES[size]
+    if width and img.width > width:
+        # reducing_gap: reduz por fator inteiro antes do LANCZOS, bem mais rápido e visualmente igual
+        img = img.resize((width, round(img.height * width / img.width)), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    img_io = io.BytesIO()
+    if fmt == 'webp':
+        img.save(img_io, format='WEBP', quality=85, method=4)
+    else:
+        img.save(img_io, format='PNG', optimize=True)
+    return img_io.getvalue()
+
+def get_invite_card_variant(qr_hash, guest_name, party, size, fmt, qr_data=None):
+    """Como get_invite_card_png, mas para qualquer variante; as variantes também ficam em cache."""
+    if size == 'full' and fmt == 'png':
+        return get_invite_card_png(qr_hash, guest_name, party, qr_data)
+    qr_data = qr_data or qr_hash
+    variant = f"{size}.{fmt}"
+    fingerprint = InviteCardCache.fingerprint(qr_data, guest_name, party)
+    data = invite_card_cache.get(party.id, qr_hash, fingerprint, variant)
+    if data is None:
+        # Reaproveita o PNG cheio se já estiver em cache; senão monta o convite e codifica só a variante
+        png_data = invite_card_cache.get(party.id, qr_hash, fingerprint)
+        img = Image.open(io.BytesIO(png_data)) if png_data is not None else compose_invite_card(qr_data, guest_name, party)
+        if img is None:
+            return None
+        data = convert_invite_card(img, size, fmt)
+        invite_card_cache.set(party.id, qr_hash, fingerprint, data, variant)
+    return data
+
+def invite_card_response(data, size, fmt, negotiated, etag=None):
+    response = Response(data, mimetype=INVITE_CARD_FORMATS[fmt])
+    if negotiated:
+        response.vary.add('Accept')
+    if etag:
+        response.set_etag(f"{etag}-{size}-{fmt}")
+        return response.make_conditional(request)
+    return response
+
+# --- Renderização de Convites em Lote ---
+# Exportações com milhares de convites são renderizadas em um pool de processos (a renderização
+# é CPU-bound e o GIL impediria ganho com threads). Os lotes são enviados aos poucos, então a
+# memória fica limitada a alguns lotes em andamento, independente do tamanho da festa.
+INVITE_RENDER_WORKERS = int(os.environ.get('INVITE_RENDER_WORKERS', os.cpu_count() or 1))
+INVITE_RENDER_BATCH_SIZE = 50
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # 'spawn' evita herdar via fork as conexões do banco e os locks de threads do worker web
+            _render_pool = ProcessPoolExecutor(max_workers=INVITE_RENDER_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _render_pool
+
+def reset_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+def party_render_snapshot(party):
+    """Cópia leve (e serializável) dos campos da festa usados na renderização do convite."""
+    return SimpleNamespace(id=party.id, name=party.name, logo_filename=party.logo_filename,
+                           logo_card_filename=party.logo_card_filename, logo_palette=party.logo_palette,
+                           invite_font=party.invite_font)
+
+def _render_invite_card_batch(party, guests):
+    """Executado nos processos do pool: lê do cache em disco ou renderiza um lote de convites."""
+    return [get_invite_card_png(qr_hash, guest_name, party, qr_data) for qr_hash, guest_name, qr_data in guests]
+
+def _render_guest_qr_batch(guests):
+    """Executado nos processos do pool: gera o PNG (1 bit) apenas da matriz do QR Code de cada convidado."""
+    results = []
+    for _, _, qr_data in guests:
+        img_io = io.BytesIO()
+        make_guest_qr_image(qr_data).convert('1').save(img_io, format='PNG', optimize=True)
+        results.append(img_io.getvalue())
+    return results
+
+def map_in_render_pool(batch_func, items, *args):
+    """
+    Gera (item, resultado) para cada item, na mesma ordem, chamando batch_func(*args, lote)
+    nos processos do pool. Só alguns lotes ficam em andamento por vez.
+    """
+    pool = get_render_pool()
+    max_in_flight = INVITE_RENDER_WORKERS * 2
+    in_flight = deque()
+    try:
+        for start in range(0, len(items), INVITE_RENDER_BATCH_SIZE):
+            batch = items[start:start + INVITE_RENDER_BATCH_SIZE]
+            in_flight.append((batch, pool.submit(batch_func, *args, batch)))
+            if len(in_flight) >= max_in_flight:
+                batch, future = in_flight.popleft()
+                yield from zip(batch, future.result())
+        while in_flight:
+            batch, future = in_flight.popleft()
+            yield from zip(batch, future.result())
+    except BrokenProcessPool:
+        app.logger.error("Pool de renderização de convites foi interrompido. Recriando no próximo uso.")
+        reset_render_pool()
+        raise
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+def render_invite_cards(party, guests):
+    """
+    Gera (qr_hash, nome, png) para cada (qr_hash, nome, conteúdo do QR) em `guests`, na mesma
+    ordem, renderizando em paralelo no pool de processos. Convites que falharem vêm com png None.
+    """
+    for (qr_hash, name, _), png_data in map_in_render_pool(_render_invite_card_batch, guests, party_render_snapshot(party)):
+        yield qr_hash, name, png_data
+
+class StreamingBuffer(io.RawIOBase):
+    """Destino não-pesquisável para ZipFile/FPDF: acumula o que foi escrito até ser consumido."""
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+    def writable(self):
+        return True
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def get_eligible_guests_for_cards(party_id):
+    """(qr_hash, nome, conteúdo do QR) dos convidados cujo ingresso pode ser emitido (pago ou gratuito)."""
+    guests = db.session.query(Guest.id, Guest.qr_hash, Guest.name).filter(
+        Guest.party_id == party_id,
+        Guest.payment_status.in_(['paid', 'not_applicable'])
+    ).order_by(Guest.name, Guest.id).all()
+    return [(qr_hash, name, guest_qr_data(party_id, guest_id, qr_hash)) for guest_id, qr_hash, name in guests]
+
 @app.route('/qr/<string:qr_hash>.png')
 def serve_qr_code(qr_hash):
     guest = Guest.query.filter_by(qr_hash=qr_hash).first_or_404()
     if guest.payment_status == 'paid' or guest.payment_status == 'not_applicable':
-        img_buffer = generate_qr_code_image(guest.qr_hash, guest.name, guest.party)
-        if img_buffer:
-            return Response(img_buffer, mimetype='image/png')
+        size, fmt, negotiated = negotiate_invite_card_variant()
+        party = guest.party
+        qr_data = guest_qr_data(guest.party_id, guest.id, guest.qr_hash)
+        card_data = get_invite_card_variant(guest.qr_hash, guest.name, party, size, fmt, qr_data)
+        if card_data:
+            etag = InviteCardCache.fingerprint(qr_data, guest.name, party)
+            return invite_card_response(card_data, size, fmt, negotiated, etag=etag)
         else:
             abort(500, description="Falha ao gerar a imagem do QR Code.")
     else:
@@ -538,12 +1339,11 @@ def delete_party(party_id):
         flash("Apenas o dono da festa pode deletá-la.", "danger")
         return redirect(url_for('dashboard'))
 
-    if party.logo_filename:
-        try: os.remove(os.path.join(PARTY_LOGOS_SAVE_PATH, party.logo_filename))
-        except OSError: pass
+    remove_party_logo_files(party)
 
     db.session.delete(party)
     db.session.commit()
+    invite_card_cache.invalidate_party(party_id)
 
     flash(f'A festa "{party.name}" foi removida.', 'success')
     return redirect(url_for('dashboard'))
@@ -559,18 +1359,15 @@ def upload_logo(party_id):
     if file.filename == '':
         return jsonify({'success': False, 'message': 'Nenhum arquivo selecionado.'}), 400
     if file and allowed_file(file.filename):
-        if party.logo_filename:
-            try:
-                os.remove(os.path.join(PARTY_LOGOS_SAVE_PATH, party.logo_filename))
-            except OSError:
-                pass
-        filename = secure_filename(file.filename)
-        unique_id = uuid.uuid4().hex
-        ext = filename.rsplit('.', 1)[1].lower()
-        new_filename = f"{party_id}_{unique_id}.{ext}"
-        file.save(os.path.join(PARTY_LOGOS_SAVE_PATH, new_filename))
-        party.logo_filename = new_filename
+        try:
+            new_filename, card_filename, palette = ingest_party_logo(file.stream, party_id)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            app.logger.warning(f"Logo inválido enviado para a festa {party_id}: {e}")
+            return jsonify({'success': False, 'message': 'Não foi possível ler a imagem enviada.'}), 400
+        remove_party_logo_files(party)
+        party.logo_filename, party.logo_card_filename, party.logo_palette = new_filename, card_filename, palette
         db.session.commit()
+        invite_card_cache.invalidate_party(party_id)
         logo_url = url_for('serve_persistent_file', filename=f'{PARTY_LOGOS_FOLDER_NAME}/{new_filename}')
         return jsonify({'success': True, 'message': 'Logo da festa atualizado!', 'logo_url': logo_url})
     else:
@@ -586,6 +1383,7 @@ def update_party_details(party_id):
     new_party_name = data.get('party_name', '').strip()
     if not new_party_name:
         return jsonify({'success': False, 'message': 'O nome da festa não pode ser vazio.'}), 400
+    name_changed = party.name != new_party_name
     party.name = new_party_name
 
     party.public_description = data.get('public_description')
@@ -621,6 +1419,8 @@ def update_party_details(party_id):
         party.event_time = None
 
     db.session.commit()
+    if name_changed:
+        invite_card_cache.invalidate_party(party_id)
     return jsonify({'success': True, 'message': 'Informações da festa atualizadas!', 'party_name': party.name})
 
 
@@ -991,27 +1791,166 @@ def abacatepay_webhook():
     return jsonify({'status': 'received', 'message': 'Event not processed or already handled'}), 200
 
 
-def get_party_stats_data(party_id):
-    total_invited = Guest.query.filter_by(party_id=party_id).count()
-    entered_count = Guest.query.filter_by(party_id=party_id, entered=True).count()
-    not_entered_count = total_invited - entered_count
-    party = Party.query.get(party_id)
-
-    total_revenue = db.session.query(db.func.sum(Guest.purchase_price)).filter(
-        Guest.party_id == party_id,
-        Guest.payment_status == 'paid'
-    ).scalar() or 0.0
-
-    total_paid_tickets = Guest.query.filter_by(party_id=party_id, payment_status='paid').count()
-
+class PartyStatsCache:
+    """
+    Cache em memória, com TTL curto, das estatísticas de cada festa. Os commits que alteram
+    convidados invalidam a festa neste worker; nos demais, o TTL limita o atraso. Cada
+    invalidação avança um relógio e marca a festa com ele, então um cálculo que começou antes
+    dela não é guardado. As marcas mais antigas são descartadas junto com o limite de itens: o
+    relógio da última descartada vira um piso, e cálculos anteriores a ele nunca são guardados.
+    """
+    def __init__(self, ttl, max_items=1024):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._invalidations = OrderedDict()
+        self._clock = 0
+        self._forgotten_clock = 0
+        self._lock = threading.Lock()
+
+    def get(self, party_id):
+        """Devolve (estatísticas ou None, geração); a geração é repassada para set()."""
+        with self._lock:
+            item = self._items.get(party_id)
+            if item is not None and item[0] > time.monotonic():
+                self._items.move_to_end(party_id)
+                return item[1], self._clock
+            return None, self._clock
+
+    def set(self, party_id, generation, stats):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            # Sem marca própria, a festa pode ter sido invalidada até o piso
+            if self._invalidations.get(party_id, self._forgotten_clock) > generation:
+                return
+            self._items[party_id] = (time.monotonic() + self.ttl, stats)
+            self._items.move_to_end(party_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate(self, party_id):
+        with self._lock:
+            self._items.pop(party_id, None)
+            self._clock += 1
+            self._invalidations[party_id] = self._clock
+            self._invalidations.move_to_end(party_id)
+            while len(self._invalidations) > self.max_items:
+                _, self._forgotten_clock = self._invalidations.popitem(last=False)
+
+party_stats_cache = PartyStatsCache(PARTY_STATS_CACHE_TTL)
+
+def mark_party_stats_stale(session, party_id):
+    """Agenda a invalidação das estatísticas da festa para quando a transação da sessão for confirmada."""
+    session.info.setdefault('stale_party_stats', set()).add(party_id)
+
+@event.listens_for(Session, 'after_flush')
+def mark_party_stats_stale_on_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Guest) and obj.party_id is not None:
+            mark_party_stats_stale(session, obj.party_id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_stale_party_stats(session):
+    for party_id in session.info.pop('stale_party_stats', ()):
+        party_stats_cache.invalidate(party_id)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_stale_party_stats(session):
+    session.info.pop('stale_party_stats', None)
+
+def build_party_counters(total_invited, entered_count):
     return {
         'total_invited': total_invited,
-        'total_paid_tickets': total_paid_tickets,
         'entered_count': entered_count,
-        'not_entered_count': not_entered_count,
-        'percentage_entered': round((entered_count / total_invited) * 100, 2) if total_invited > 0 else 0.0,
-        'total_revenue': total_revenue
+        'not_entered_count': total_invited - entered_count,
+        'percentage_entered': round((entered_count / total_invited) * 100, 2) if total_invited > 0 else 0.0
+    }
+
+def get_party_counters(party_id):
+    """
+    Contadores de presença da festa (com as mesmas chaves de /stats), lidos dos contadores
+    materializados. Chamada antes do commit de um check-in, já enxerga a entrada que acabou de ser registrada.
+    """
+    row = db.session.execute(db.select(Party.guest_count, Party.entered_count).where(Party.id == party_id)).first()
+    return build_party_counters(*(row or (0, 0)))
+
+def get_party_stats_snapshot(party_id):
+    """
+    (versão da festa, estatísticas completas), lidas juntas da linha da festa e servidas pelo
+    party_stats_cache: a versão sempre corresponde aos números que a acompanham.
+    """
+    cached, generation = party_stats_cache.get(party_id)
+    if cached is not None:
+        return cached[0], dict(cached[1])
+
+    row = db.session.execute(
+        db.select(Party.version, Party.guest_count, Party.entered_count, Party.paid_count, Party.paid_revenue).where(Party.id == party_id)
+    ).first()
+    version, total_invited, entered_count, total_paid_tickets, total_revenue = row or (0, 0, 0, 0, 0.0)
+
+    counters = build_party_counters(total_invited, entered_count)
+    stats = {
+        'total_invited': counters['total_invited'],
+        'total_paid_tickets': total_paid_tickets,
+        'entered_count': counters['entered_count'],
+        'not_entered_count': counters['not_entered_count'],
+        'percentage_entered': counters['percentage_entered'],
+        'total_revenue': total_revenue or 0.0
     }
+    party_stats_cache.set(party_id, generation, (version, stats))
+    return version, dict(stats)
+
+def get_party_stats_data(party_id):
+    return get_party_stats_snapshot(party_id)[1]
+
+def reconcile_party_counters(party_id=None):
+    """
+    Refaz os contadores materializados a partir dos convidados (de uma festa ou de todas) num único
+    UPDATE e devolve as festas cujos valores estavam divergentes.
+    """
+    is_paid = Guest.payment_status == 'paid'
+    actual = (
+        db.select(
+            Party.id.label('party_id'),
+            db.func.count(Guest.id).label('guest_count'),
+            db.func.count(db.case((Guest.entered == True, Guest.id))).label('entered_count'),
+            db.func.count(db.case((is_paid, Guest.id))).label('paid_count'),
+            db.func.coalesce(db.func.sum(db.case((is_paid, Guest.purchase_price), else_=0.0)), 0.0).label('paid_revenue'),
+        )
+        .outerjoin(Guest, Guest.party_id == Party.id)
+        .group_by(Party.id)
+    )
+    if party_id is not None:
+        actual = actual.where(Party.id == party_id)
+    actual = actual.subquery()
+    drifted = db.session.execute(
+        db.select(actual.c.party_id).join(Party, Party.id == actual.c.party_id).where(db.or_(
+            *(getattr(Party, column) != getattr(actual.c, column) for column in PARTY_COUNTER_COLUMNS)
+        ))
+    ).scalars().all()
+    if drifted:
+        db.session.execute(
+            db.update(Party)
+            .where(Party.id.in_(drifted), Party.id == actual.c.party_id)
+            # A versão avança para que as respostas com ETag (ver party_not_modified) tragam os valores corrigidos
+            .values(version=Party.version + 1, **{column: getattr(actual.c, column) for column in PARTY_COUNTER_COLUMNS})
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    for drifted_id in drifted:
+        party_stats_cache.invalidate(drifted_id)
+    return drifted
+
+@app.cli.command('reconcile-party-counters')
+@click.option('--party-id', type=int, default=None, help="Reconciliar só esta festa.")
+def reconcile_party_counters_command(party_id):
+    """Recalcula os contadores materializados das festas a partir dos convidados."""
+    drifted = reconcile_party_counters(party_id)
+    if drifted:
+        click.echo(f"Contadores corrigidos em {len(drifted)} festa(s): {', '.join(map(str, drifted))}")
+    else:
+        click.echo("Contadores já estavam corretos.")
 
 @app.route('/api/party/<int:party_id>/preview_invite', methods=['GET'])
 @login_required
@@ -1023,19 +1962,47 @@ def preview_invite(party_id):
     test_guest_name = "Nome do Convidado Teste"
     test_qr_hash = "PREVIEW_QR_HASH"
 
-    # Obter a fonte da query string, se disponível, caso contrário, usar a fonte da festa
-    font_to_use = request.args.get('font_name', party.invite_font)
-
-    # Passar a fonte para a função de geração de imagem
-    img_buffer = generate_qr_code_image(test_qr_hash, test_guest_name, party, font_override=font_to_use)
-    if img_buffer:
-        return Response(img_buffer, mimetype='image/png')
+    # Obter a fonte da query string, se disponível, caso contrário, usar a fonte da festa.
+    # A prévia fica em cache por (festa, fonte): trocar entre as fontes só renderiza cada uma uma vez.
+    preview_party = party_render_snapshot(party)
+    preview_party.invite_font = resolve_invite_font_name(request.args.get('font_name', party.invite_font))
+
+    # Por padrão a prévia sai em tamanho reduzido; ?size=full devolve o convite em tamanho cheio
+    size, fmt, negotiated = negotiate_invite_card_variant(default_size='medium')
+    data = get_invite_card_variant(test_qr_hash, test_guest_name, preview_party, size, fmt)
+    if data:
+        fingerprint = InviteCardCache.fingerprint(test_qr_hash, test_guest_name, preview_party)
+        response = invite_card_response(data, size, fmt, negotiated, etag=fingerprint)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
     else:
         abort(500, description="Falha ao gerar a imagem de pré-visualização do convite.")
 
+# --- Respostas Condicionais ---
+# As telas consultam lista, estatísticas e gráfico o tempo todo, e entre uma leitura e outra quase
+# nunca há mudança. Essas respostas levam uma ETag fraca com a versão da festa (ver
+# bump_party_version) e Cache-Control no-cache: o navegador revalida cada fetch com If-None-Match
+# sozinho e, com a versão igual, recebe 304 antes de qualquer consulta pesada e reaproveita o corpo.
+def party_data_etag(version):
+    return f"party-{version}"
+
+def with_party_etag(response, version):
+    response.set_etag(party_data_etag(version), weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def party_not_modified(version):
+    """Resposta 304 se o If-None-Match traz a versão atual da festa; None caso contrário."""
+    if request.if_none_match.contains_weak(party_data_etag(version)):
+        return with_party_etag(app.response_class(status=304), version)
+    return None
+
 @app.route('/api/party/<int:party_id>/stats', methods=['GET'])
 def get_stats(party_id):
-    return jsonify(get_party_stats_data(party_id))
+    version, stats = get_party_stats_snapshot(party_id)
+    return party_not_modified(version) or with_party_etag(jsonify(stats), version)
 
 @app.route('/api/party/<int:party_id>/font_selection', methods=['GET', 'POST'])
 @login_required
@@ -1053,14 +2020,48 @@ def handle_font_selection(party_id):
             return jsonify({'message': 'Nome da fonte não fornecido.'}), 400
         
         # Basic validation to ensure the font is one of the allowed ones
-        allowed_fonts = ['Birthstone-Regular', 'Ephesis-Regular', 'Montserrat-Regular', 'Radley-Regular', 'BebasNeue-Regular', 'Cinzel-Regular', 'JosefinSans-Regular']
-        if font_name not in allowed_fonts:
+        if font_name not in ALLOWED_INVITE_FONTS:
             return jsonify({'message': 'Fonte selecionada inválida.'}), 400
 
+        font_changed = party.invite_font != font_name
         party.invite_font = font_name
         db.session.commit()
+        if font_changed:
+            invite_card_cache.invalidate_party(party_id)
         return jsonify({'message': 'Fonte do convite atualizada com sucesso!', 'selected_font': party.invite_font})
 
+# --- Paginação por Cursor da Lista de Convidados ---
+# Com ?cursor= (vazio na primeira página) a lista é paginada por keyset: o cursor leva a ordenação, o
+# valor da coluna ordenada e o id da última linha entregue, e a página seguinte começa logo depois
+# dela pelo índice, sem OFFSET. O total vai junto no cursor, então só a primeira página conta.
+def encode_guest_cursor(sort_by, sort_dir, value, last_id, total_items):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort_by, sort_dir, value, last_id, total_items], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_guest_cursor(token, sort_by, sort_dir):
+    """Devolve (valor, último id, total) ou None se o cursor for inválido ou de outra ordenação."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        cursor_sort_by, cursor_sort_dir, value, last_id, total_items = json.loads(raw)
+        if (cursor_sort_by, cursor_sort_dir) != (sort_by, sort_dir) or not isinstance(last_id, int) or not isinstance(total_items, int):
+            return None
+        if sort_by == 'check_in_time' and value is not None:
+            value = datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        return None
+    return value, last_id, total_items
+
+def keyset_after(column, value, last_id, descending):
+    """Linhas depois de (value, last_id) na ordem `column [desc] nulls last, id [desc]`."""
+    id_after = Guest.id < last_id if descending else Guest.id > last_id
+    if value is None:
+        return db.and_(column.is_(None), id_after)
+    value = db.literal(value, type_=column.type) # como literal para aceitar também colunas booleanas
+    column_after = column < value if descending else column > value
+    return db.or_(column_after, db.and_(column == value, id_after), column.is_(None))
+
 @app.route('/api/party/<int:party_id>/guests', methods=['GET', 'POST'])
 @login_required
 def handle_guests(party_id):
@@ -1085,79 +2086,586 @@ def handle_guests(party_id):
         return jsonify({
             'id': new_guest.id, 'name': new_guest.name, 'qr_hash': new_guest.qr_hash, 'entered': new_guest.entered,
             'qr_image_url': new_guest.qr_image_url, 'check_in_time': new_guest.get_check_in_time_str(),
-            'added_by': new_guest.adder.username, 'payment_status': new_guest.payment_status
+            'added_by': current_user.username, 'payment_status': new_guest.payment_status
         }), 201
 
+    not_modified = party_not_modified(party.version)
+    if not_modified: return not_modified
+
     page, per_page, search_term = request.args.get('page', 1, type=int), request.args.get('per_page', 50, type=int), request.args.get('search')
     sort_by, sort_dir = request.args.get('sort_by', 'name'), request.args.get('sort_dir', 'asc')
-    query = Guest.query.filter_by(party_id=party_id)
-    if search_term: query = query.filter(Guest.name.ilike(f'%{search_term.strip()}%'))
+    page, per_page = max(page, 1), per_page if per_page > 0 else 20
+    cursor = request.args.get('cursor')
+
+    # Só as colunas serializadas, com os nomes de quem cadastrou e de quem comprou vindos de JOINs
+    # na mesma consulta (uma página custa sempre uma consulta, mais a contagem quando há busca).
+    adder, purchaser = db.aliased(User), db.aliased(User)
+    filters = [Guest.party_id == party_id]
+    search_term = normalize_search_text(search_term)
+    if search_term: filters.append(Guest.search_name.contains(search_term, autoescape=True))
+
+    sort_columns = {'name': Guest.name, 'entered': Guest.entered, 'check_in_time': Guest.check_in_time, 'added_by': adder.username, 'payment_status': Guest.payment_status}
+    if search_term:
+        # Relevância da busca: nome igual ao termo, depois começando por ele, depois com uma palavra começando por ele
+        sort_columns['relevance'] = db.case(
+            (Guest.search_name == search_term, 0),
+            (Guest.search_name.startswith(search_term, autoescape=True), 1),
+            (Guest.search_name.contains(' ' + search_term, autoescape=True), 2),
+            else_=3
+        )
+    if sort_by not in sort_columns: sort_by = 'name'
+    if sort_dir != 'desc': sort_dir = 'asc'
+    order_column, descending = sort_columns[sort_by], sort_dir == 'desc'
+    order_func = order_column.desc() if descending else order_column.asc()
+    if order_column is Guest.check_in_time:
+        # Só check_in_time aceita nulos; nas colunas NOT NULL o NULLS LAST impediria o índice de servir a ordem decrescente
+        order_func = order_func.nullslast()
+    # O id desempata, então a ordem é total e o cursor sempre aponta para uma única posição
+    tiebreaker = Guest.id.desc() if descending else Guest.id.asc()
+
+    total_items = None
+    if cursor:
+        after = decode_guest_cursor(cursor, sort_by, sort_dir)
+        if after is None: return jsonify({'error': 'Cursor de paginação inválido.'}), 400
+        value, last_id, total_items = after
+        filters.append(keyset_after(order_column, value, last_id, descending))
+
+    guests_query = (
+        db.select(
+            Guest.id, Guest.name, Guest.qr_hash, Guest.entered, Guest.check_in_time, Guest.payment_status,
+            Guest.purchase_link_id, Guest.purchase_price, adder.username.label('added_by'), purchaser.username.label('purchased_by'),
+            order_column.label('sort_value')
+        )
+        .outerjoin(adder, adder.id == Guest.added_by_user_id)
+        .outerjoin(purchaser, purchaser.id == Guest.purchased_by_user_id)
+        .where(*filters)
+        .order_by(order_func, tiebreaker)
+    )
+    if cursor is not None:
+        rows = db.session.execute(guests_query.limit(per_page + 1)).all()
+        has_next, rows = len(rows) > per_page, rows[:per_page]
+    else:
+        rows = db.session.execute(guests_query.limit(per_page).offset((page - 1) * per_page)).all()
+    if total_items is None:
+        if search_term:
+            total_items = db.session.execute(db.select(db.func.count(Guest.id)).where(*filters)).scalar()
+        else:
+            total_items = party.guest_count
+
+    guests_data = [{
+        'id': g.id, 'name': g.name, 'qr_hash': g.qr_hash, 'entered': g.entered, 'qr_image_url': url_for('serve_qr_code', qr_hash=g.qr_hash),
+        'check_in_time': format_check_in_time(g.check_in_time), 'added_by': g.added_by or 'N/A',
+        'payment_status': g.payment_status, 'purchased_by': g.purchased_by, 'purchase_link_id': g.purchase_link_id,
+        'purchase_price': g.purchase_price
+    } for g in rows]
+
+    if cursor is not None:
+        last = rows[-1] if rows else None
+        next_cursor = encode_guest_cursor(sort_by, sort_dir, last.sort_value, last.id, total_items) if has_next else None
+        return with_party_etag(jsonify({
+            'guests': guests_data,
+            'pagination': {'per_page': per_page, 'total_items': total_items, 'has_next': has_next, 'next_cursor': next_cursor}
+        }), party.version)
+
+    total_pages = -(-total_items // per_page)
+    return with_party_etag(jsonify({
+        'guests': guests_data,
+        'pagination': {
+            'page': page, 'per_page': per_page, 'total_pages': total_pages,
+            'total_items': total_items, 'has_next': page < total_pages, 'has_prev': page > 1
+        }
+    }), party.version)
 
-    sort_columns = {'name': Guest.name, 'entered': Guest.entered, 'check_in_time': Guest.check_in_time, 'added_by': User.username, 'payment_status': Guest.payment_status}
+# --- Check-in ---
+CHECK_IN_NEW_ENTRY, CHECK_IN_ALREADY_ENTERED = 'new_entry', 'already_entered'
+CHECK_IN_PAYMENT_PENDING, CHECK_IN_INVALID = 'payment_pending', 'invalid'
 
-    if sort_by == 'added_by':
-        query = query.join(User, Guest.added_by_user_id == User.id)
+def check_in_live_event(row, check_in_time):
+    """Evento ao vivo de uma entrada liberada pelo UPDATE condicional (que não passa pelo flush do ORM)."""
+    return {
+        'type': 'check_in', 'id': row.id, 'qr_hash': row.qr_hash, 'name': row.name, 'entered': True,
+        'check_in_time': format_check_in_time(check_in_time), 'payment_status': row.payment_status
+    }
 
-    order_column = sort_columns.get(sort_by, Guest.name)
-    order_func = order_column.desc() if sort_dir == 'desc' else order_column.asc()
+def check_in_guest(party_id, code, check_in_time=None, device=None):
+    """
+    Marca a entrada com um UPDATE condicional (ainda não entrou e ingresso pago ou gratuito): com
+    vários scanners lendo o mesmo ingresso ao mesmo tempo, só um deles libera a entrada.
+    `code` é o conteúdo lido do QR (qr_hash ou ingresso assinado; ver parse_ticket) e `device`, o
+    aparelho que leu, registrado no histórico de entradas.
+    Retorna (resultado, convidado, contadores): convidado é um dict com id, name, qr_hash,
+    payment_status e check_in_time, e contadores vem de get_party_counters, lido na mesma transação;
+    os dois são None se o QR Code não for desta festa.
+    """
+    ticket = parse_ticket(code, party_id)
+    if ticket is None:
+        # Assinatura inválida ou ingresso de outra festa: rejeitado sem ir ao banco
+        return CHECK_IN_INVALID, None, None
+    check_in_time = check_in_time or datetime.now(BRASILIA_TZ)
+    guest_filter = (ticket_filter(ticket), Guest.party_id == party_id)
+    ticket_price = db.select(Party.ticket_price).where(Party.id == Guest.party_id).scalar_subquery()
+    can_enter = (*guest_filter, Guest.entered == False, db.or_(Guest.payment_status == 'paid', ticket_price <= 0))
+    checked_in = (
+        db.update(Guest)
+        .where(*can_enter)
+        .values(entered=True, check_in_time=check_in_time)
+        .returning(Guest.id, Guest.check_in_time, Guest.version)
+        .execution_options(synchronize_session=False)
+    )
+    guest_query = (
+        db.select(Guest.id, Guest.name, Guest.qr_hash, Guest.payment_status, Guest.check_in_time, Party.ticket_price)
+        .join(Party, Party.id == Guest.party_id)
+        .where(*guest_filter)
+    )
+
+    if db.engine.dialect.name == 'postgresql':
+        # Uma única instrução: os UPDATEs (versão da festa, depois o convidado) e o INSERT no histórico
+        # rodam em CTEs e o SELECT externo traz o que é preciso para classificar o resultado (o SELECT
+        # enxerga a linha como estava antes do UPDATE).
+        # O convidado é travado (FOR UPDATE) antes de a festa subir de versão: um segundo scanner com o
+        # mesmo ingresso espera o primeiro terminar e, relendo a linha já com entered, não mexe na festa.
+        locked = db.select(Guest.id).where(*can_enter).with_for_update().cte('locked')
+        bumped = (
+            db.update(Party)
+            .where(Party.id == party_id, db.select(locked.c.id).exists())
+            .values(version=Party.version + 1, entered_count=Party.entered_count + 1)
+            .returning(Party.version)
+            .cte('bumped')
+        )
+        checked_in = (
+            checked_in.where(Guest.id.in_(db.select(locked.c.id)), db.select(bumped.c.version).exists())
+            .values(version=db.select(bumped.c.version).scalar_subquery())
+            .cte('checked_in')
+        )
+        logged = (
+            db.insert(CheckInEvent)
+            .from_select(
+                ['party_id', 'guest_id', 'kind', 'occurred_at', 'device', 'version'],
+                db.select(db.literal(party_id), checked_in.c.id, db.literal(CHECK_IN_EVENT_ENTRY), checked_in.c.check_in_time,
+                          db.literal(device, type_=db.String), checked_in.c.version)
+            )
+            .returning(CheckInEvent.id)
+            .cte('logged')
+        )
+        row = db.session.execute(
+            guest_query.add_columns(checked_in.c.id.label('checked_in_id'), checked_in.c.check_in_time.label('new_check_in_time'))
+            .outerjoin(checked_in, checked_in.c.id == Guest.id)
+            .add_cte(logged)
+        ).first()
+    else:
+        # SQLite não aceita UPDATE dentro de CTE: o UPDATE continua decidindo sozinho e a leitura
+        # do convidado vem logo em seguida, na mesma transação.
+        updated = db.session.execute(checked_in).first()
+        if updated is not None:
+            version = bump_party_version(db.session.connection(), party_id, counters={'entered_count': 1})
+            db.session.execute(db.update(Guest).where(Guest.id == updated.id).values(version=version).execution_options(synchronize_session=False))
+            db.session.execute(db.insert(CheckInEvent).values(
+                party_id=party_id, guest_id=updated.id, kind=CHECK_IN_EVENT_ENTRY, occurred_at=updated.check_in_time, device=device, version=version
+            ))
+        row = db.session.execute(guest_query.add_columns(
+            db.literal(updated.id if updated else None).label('checked_in_id'),
+            db.literal(updated.check_in_time if updated else None, type_=db.DateTime).label('new_check_in_time'),
+        )).first()
+    if row is None:
+        db.session.commit()
+        return CHECK_IN_INVALID, None, None
+    counters = get_party_counters(party_id)
+    if row.checked_in_id is not None:
+        publish_party_events(db.session, party_id, [{**check_in_live_event(row, row.new_check_in_time), 'counters': counters}])
+        mark_party_stats_stale(db.session, party_id)
+    db.session.commit()
+
+    guest = {'id': row.id, 'name': row.name, 'qr_hash': row.qr_hash, 'payment_status': row.payment_status, 'check_in_time': row.check_in_time}
+    if row.checked_in_id is not None:
+        guest['check_in_time'] = row.new_check_in_time
+        return CHECK_IN_NEW_ENTRY, guest, counters
+    if row.ticket_price > 0 and row.payment_status != 'paid':
+        return CHECK_IN_PAYMENT_PENDING, guest, counters
+    if guest['check_in_time'] is None:
+        # Outro scanner liberou este ingresso enquanto o UPDATE esperava pela linha
+        guest['check_in_time'] = db.session.scalar(db.select(Guest.check_in_time).where(Guest.id == row.id))
+    return CHECK_IN_ALREADY_ENTERED, guest, counters
+
+def check_in_guests(party_id, scans, first_scan_wins=False, device=None):
+    """
+    Versão em lote de check_in_guest para leituras enfileiradas: recebe [(código lido, horário da leitura)]
+    e devolve [(resultado, convidado)] na mesma ordem. Todo o lote usa um único UPDATE condicional,
+    uma única leitura e um único commit. Se o mesmo ingresso aparece mais de uma vez, a leitura mais
+    antiga é a que libera a entrada (e define o horário do check-in).
+    Com first_scan_wins, uma leitura anterior ao check-in já registrado (feita offline em outro
+    aparelho) passa a ser o horário oficial da entrada; como o convidado já tinha entrado, o resultado
+    dela é already_entered.
+    """
+    tickets = [(parse_ticket(code, party_id), scanned_at) for code, scanned_at in scans]
+    first_scans = {}
+    for ticket, scanned_at in tickets:
+        if ticket is not None and (ticket not in first_scans or scanned_at < first_scans[ticket]):
+            first_scans[ticket] = scanned_at
+    if not first_scans:
+        return [(CHECK_IN_INVALID, None) for _ in scans]
+
+    guest_ids = [value for kind, value in first_scans if kind == 'guest_id']
+    qr_hashes = [value for kind, value in first_scans if kind == 'qr_hash']
+    guest_filter = (Guest.party_id == party_id, db.or_(Guest.id.in_(guest_ids), Guest.qr_hash.in_(qr_hashes)))
+    ticket_price = db.select(Party.ticket_price).where(Party.id == Guest.party_id).scalar_subquery()
+    can_enter = (*guest_filter, db.or_(Guest.payment_status == 'paid', ticket_price <= 0))
+    # Em ordem de horário: se o mesmo convidado foi lido nos dois formatos, vale a leitura mais antiga
+    scan_time = db.case(*[(ticket_filter(ticket), scanned_at) for ticket, scanned_at in sorted(first_scans.items(), key=lambda item: item[1])])
+    entry = (
+        db.update(Guest)
+        .where(*can_enter)
+        .values(entered=True, check_in_time=scan_time)
+        .returning(Guest.id, Guest.qr_hash, Guest.check_in_time)
+        .execution_options(synchronize_session=False)
+    )
+    checked_in = db.session.execute(entry.where(Guest.entered == False)).all()
+    corrected, previous_check_in_times = [], {}
+    if first_scan_wins:
+        # Em UPDATE separado: quem já tinha entrado só tem o horário corrigido e não conta no entered_count.
+        # O horário anterior é lido antes (com a linha travada) para ficar no histórico junto com o novo.
+        previous_check_in_times = dict(db.session.execute(
+            db.select(Guest.id, Guest.check_in_time)
+            .where(*can_enter, Guest.entered == True, Guest.check_in_time > scan_time)
+            .with_for_update()
+        ).all())
+        if previous_check_in_times:
+            corrected = db.session.execute(entry.where(Guest.id.in_(previous_check_in_times))).all()
+    if checked_in or corrected:
+        version = bump_party_version(db.session.connection(), party_id, counters={'entered_count': len(checked_in)})
+        db.session.execute(
+            db.update(Guest).where(Guest.id.in_([row.id for row in checked_in + corrected])).values(version=version)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(db.insert(CheckInEvent), [
+            {
+                'party_id': party_id, 'guest_id': row.id, 'kind': CHECK_IN_EVENT_ENTRY_CORRECTED if row.id in previous_check_in_times else CHECK_IN_EVENT_ENTRY,
+                'occurred_at': row.check_in_time, 'previous_occurred_at': previous_check_in_times.get(row.id), 'device': device, 'version': version
+            }
+            for row in checked_in + corrected
+        ])
+    guests = {}
+    for row in db.session.execute(
+        db.select(Guest.id, Guest.name, Guest.qr_hash, Guest.payment_status, Guest.check_in_time, Party.ticket_price)
+        .join(Party, Party.id == Guest.party_id)
+        .where(*guest_filter)
+    ):
+        guests[('guest_id', row.id)] = guests[('qr_hash', row.qr_hash)] = row
+    if checked_in or corrected:
+        party_events = [check_in_live_event(guests[('guest_id', row.id)], guests[('guest_id', row.id)].check_in_time) for row in checked_in + corrected]
+        party_events[-1]['counters'] = get_party_counters(party_id)
+        publish_party_events(db.session, party_id, party_events)
+        mark_party_stats_stale(db.session, party_id)
+    db.session.commit()
 
-    pagination = query.order_by(order_func.nullslast()).paginate(page=page, per_page=per_page, error_out=False)
+    first_scan_by_guest = {}
+    for ticket, scanned_at in first_scans.items():
+        row = guests.get(ticket)
+        if row is not None and (row.id not in first_scan_by_guest or scanned_at < first_scan_by_guest[row.id]):
+            first_scan_by_guest[row.id] = scanned_at
+    pending_new_entries = {row.id for row in checked_in}
+    results = []
+    for ticket, scanned_at in tickets:
+        row = guests.get(ticket)
+        if row is None:
+            results.append((CHECK_IN_INVALID, None))
+            continue
+        guest = {'id': row.id, 'name': row.name, 'qr_hash': row.qr_hash, 'payment_status': row.payment_status, 'check_in_time': row.check_in_time}
+        if row.id in pending_new_entries and scanned_at == first_scan_by_guest[row.id]:
+            pending_new_entries.discard(row.id)
+            results.append((CHECK_IN_NEW_ENTRY, guest))
+        elif row.ticket_price > 0 and row.payment_status != 'paid':
+            results.append((CHECK_IN_PAYMENT_PENDING, guest))
+        else:
+            results.append((CHECK_IN_ALREADY_ENTERED, guest))
+    return results
 
-    guests_data = []
-    for g in pagination.items:
-        purchased_by_name = g.purchaser.username if g.purchaser else None
+def check_in_response(outcome, guest):
+    """Corpo e status HTTP da resposta de um check-in (leitura avulsa ou item de um lote)."""
+    if outcome == CHECK_IN_INVALID: return {'error': 'QR Code inválido para esta festa'}, 404
 
-        guests_data.append({
-            'id': g.id, 'name': g.name, 'qr_hash': g.qr_hash, 'entered': g.entered, 'qr_image_url': g.qr_image_url,
-            'check_in_time': g.get_check_in_time_str(), 'added_by': g.adder.username if g.adder else 'N/A',
-            'payment_status': g.payment_status, 'purchased_by': purchased_by_name, 'purchase_link_id': g.purchase_link_id,
-            'purchase_price': g.purchase_price
-        })
+    check_in_time_str = format_check_in_time(guest['check_in_time'])
+    if outcome == CHECK_IN_PAYMENT_PENDING:
+        return {
+            'id': guest['id'], 'name': guest['name'], 'qr_hash': guest['qr_hash'], 'entered': False,
+            'message': f"Ingresso de {guest['name']} não foi pago (Status: {guest['payment_status']}).",
+            'is_new_entry': False, 'check_in_time': check_in_time_str, 'error_type': 'payment_pending'
+        }, 403
 
-    return jsonify({
-        'guests': guests_data,
-        'pagination': {
-            'page': pagination.page, 'per_page': pagination.per_page, 'total_pages': pagination.pages,
-            'total_items': pagination.total, 'has_next': pagination.has_next, 'has_prev': pagination.has_prev
-        }
-    })
+    if outcome == CHECK_IN_ALREADY_ENTERED:
+        return {'id': guest['id'], 'name': guest['name'], 'qr_hash': guest['qr_hash'], 'entered': True, 'message': f"{guest['name']} já entrou às {check_in_time_str}.", 'is_new_entry': False, 'check_in_time': check_in_time_str}, 200
+
+    return {'id': guest['id'], 'name': guest['name'], 'qr_hash': guest['qr_hash'], 'entered': True, 'message': f"Entrada liberada! Bem-vindo(a), {guest['name']}!", 'is_new_entry': True, 'check_in_time': check_in_time_str}, 200
+
+# Por quanto tempo uma leitura feita sem rede ainda é aceita na sincronização
+CHECK_IN_MAX_OFFLINE_HOURS = float(os.environ.get('CHECK_IN_MAX_OFFLINE_HOURS', 24))
+CHECK_IN_SCAN_EXPIRED = 'scan_expired' # resultado de um item de lote lido antes dessa janela
+
+def parse_scanned_at(value, now):
+    """
+    Horário da leitura (ISO 8601) em BRASILIA_TZ; sem horário válido ou no futuro, usa `now`.
+    Anterior à janela offline (CHECK_IN_MAX_OFFLINE_HOURS), devolve None: a leitura é recusada.
+    """
+    if not value:
+        return now
+    try:
+        scanned_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return now
+    scanned_at = BRASILIA_TZ.localize(scanned_at) if scanned_at.tzinfo is None else scanned_at.astimezone(BRASILIA_TZ)
+    if scanned_at < now - timedelta(hours=CHECK_IN_MAX_OFFLINE_HOURS):
+        return None
+    return min(scanned_at, now)
+
+CHECK_IN_DEVICE_HEADER = 'X-Scanner-Device'
+
+def request_check_in_device():
+    """Identificação do aparelho/portaria que enviou a leitura (opcional), para o histórico de entradas."""
+    return (request.headers.get(CHECK_IN_DEVICE_HEADER) or '').strip()[:64] or None
 
 @app.route('/api/party/<int:party_id>/guests/<qr_hash>/enter', methods=['POST'])
 def mark_entered(party_id, qr_hash):
-    guest = Guest.query.filter_by(qr_hash=qr_hash, party_id=party_id).first()
-    if not guest: return jsonify({'error': 'QR Code inválido para esta festa'}), 404
+    outcome, guest, counters = check_in_guest(party_id, qr_hash, device=request_check_in_device())
+    payload, status = check_in_response(outcome, guest)
+    if counters is not None:
+        payload['counters'] = counters # O scanner e o painel atualizam os números sem buscar /stats
+    return jsonify(payload), status
 
-    if guest.party.ticket_price > 0 and guest.payment_status != 'paid':
-        return jsonify({
-            'id': guest.id, 'name': guest.name, 'qr_hash': guest.qr_hash, 'entered': False,
-            'message': f'Ingresso de {guest.name} não foi pago (Status: {guest.payment_status}).',
-            'is_new_entry': False, 'check_in_time': guest.get_check_in_time_str(), 'error_type': 'payment_pending'
-        }), 403
+CHECK_IN_BATCH_MAX_SCANS = 500
 
-    if guest.entered:
-        return jsonify({'id': guest.id, 'name': guest.name, 'qr_hash': guest.qr_hash, 'entered': True, 'message': f'{guest.name} já entrou às {guest.get_check_in_time_str()}.', 'is_new_entry': False, 'check_in_time': guest.get_check_in_time_str()})
+@app.route('/api/party/<int:party_id>/guests/enter_batch', methods=['POST'])
+def mark_entered_batch(party_id):
+    """
+    Check-in de várias leituras de um mesmo aparelho (catracas, leituras feitas sem rede).
+    Corpo: {"scans": [{"qr_hash": "...", "scanned_at": "ISO 8601"}, ...]} (ou pares [qr_hash, scanned_at]).
+    Responde um item por leitura, na mesma ordem, com o mesmo conteúdo de mark_entered mais
+    'outcome' e 'status' (o status HTTP que a leitura avulsa teria). Leituras anteriores à janela
+    offline voltam com outcome 'scan_expired', sem check-in.
+    """
+    party = db.session.get(Party, party_id) or abort(404)
+    check_scanner_permission(party)
+    scans = (request.get_json(silent=True) or {}).get('scans')
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'error': 'Envie as leituras em uma lista "scans".'}), 400
+    if len(scans) > CHECK_IN_BATCH_MAX_SCANS:
+        return jsonify({'error': f'Envie no máximo {CHECK_IN_BATCH_MAX_SCANS} leituras por lote.'}), 400
+    return jsonify({'results': check_in_batch(party_id, scans, device=request_check_in_device())})
+
+def check_in_batch(party_id, scans, first_scan_wins=False, device=None):
+    """Valida as leituras recebidas em JSON, faz o check-in em lote e monta um resultado por leitura."""
+    now = datetime.now(BRASILIA_TZ)
+    parsed_scans = []
+    for scan in scans:
+        if isinstance(scan, dict):
+            qr_hash, scanned_at = scan.get('qr_hash'), scan.get('scanned_at')
+        elif isinstance(scan, list) and len(scan) == 2:
+            qr_hash, scanned_at = scan
+        else:
+            qr_hash, scanned_at = None, None
+        parsed_scans.append((str(qr_hash or ''), parse_scanned_at(scanned_at, now)))
+
+    accepted_scans = [scan for scan in parsed_scans if scan[1] is not None]
+    outcomes = iter(check_in_guests(party_id, accepted_scans, first_scan_wins, device))
+    results = []
+    for qr_hash, scanned_at in parsed_scans:
+        if scanned_at is None:
+            error = f'Leitura feita há mais de {CHECK_IN_MAX_OFFLINE_HOURS:g} h; não pode mais ser sincronizada.'
+            results.append({'qr_hash': qr_hash, 'error': error, 'outcome': CHECK_IN_SCAN_EXPIRED, 'status': 400})
+            continue
+        outcome, guest = next(outcomes)
+        payload, status = check_in_response(outcome, guest)
+        results.append({'qr_hash': qr_hash, **payload, 'outcome': outcome, 'status': status})
+    return results
+
+# --- Scanner Offline ---
+# O scanner baixa um manifesto compacto da festa (digest do QR, nome, se pode entrar, se já entrou e
+# digest do ingresso assinado, para reconhecer os dois formatos de QR sem conhecer a chave), valida
+# as leituras localmente e sincroniza as entradas pelo endpoint de delta, que devolve só os
+# convidados alterados desde a versão que o aparelho já tem.
+SCANNER_MANIFEST_DIGEST_LENGTH = 16
+SCANNER_MANIFEST_FIELDS = ['digest', 'name', 'eligible', 'entered', 'signed_digest']
+
+def check_scanner_permission(party):
+    """Scanner público (cookie com o código da festa) ou organizador/colaborador logado."""
+    if request.cookies.get('party_code') == party.party_code:
+        return
+    if current_user.is_authenticated and (party.user_id == current_user.id or current_user in party.collaborators):
+        return
+    abort(403)
+
+def ticket_digest(code):
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()[:SCANNER_MANIFEST_DIGEST_LENGTH]
+
+def get_scanner_manifest(party, since=None):
+    """Manifesto da festa; com `since`, só os convidados alterados depois dessa versão (se possível)."""
+    # A versão é lida antes dos convidados: o que mudar entre as duas leituras volta de novo no próximo delta
+    version, guests_removed_version, ticket_price = db.session.execute(
+        db.select(Party.version, Party.guests_removed_version, Party.ticket_price).where(Party.id == party.id)
+    ).one()
+    full = since is None or since < guests_removed_version or since > version
+    query = db.select(Guest.id, Guest.qr_hash, Guest.name, Guest.payment_status, Guest.entered).where(Guest.party_id == party.id)
+    if not full:
+        query = query.where(Guest.version > since)
+    guests = [
+        [ticket_digest(qr_hash), name, int(ticket_price <= 0 or payment_status == 'paid'), int(entered),
+         ticket_digest(make_signed_ticket(party.id, guest_id))]
+        for guest_id, qr_hash, name, payment_status, entered in db.session.execute(query)
+    ]
+    return {'party_id': party.id, 'version': version, 'full': full, 'fields': SCANNER_MANIFEST_FIELDS, 'guests': guests}
 
-    guest.entered, guest.check_in_time = True, datetime.now(BRASILIA_TZ)
-    db.session.commit()
-    return jsonify({'id': guest.id, 'name': guest.name, 'qr_hash': guest.qr_hash, 'entered': True, 'message': f'Entrada liberada! Bem-vindo(a), {guest.name}!', 'is_new_entry': True, 'check_in_time': guest.get_check_in_time_str()})
+@app.route('/api/party/<int:party_id>/scanner/manifest', methods=['GET'])
+def scanner_manifest(party_id):
+    party = db.session.get(Party, party_id) or abort(404)
+    check_scanner_permission(party)
+    return jsonify(get_scanner_manifest(party))
+
+@app.route('/api/party/<int:party_id>/scanner/sync', methods=['POST'])
+def scanner_sync(party_id):
+    """
+    Envia as entradas feitas offline e recebe o delta do manifesto.
+    Corpo: {"since": versão do manifesto local, "scans": [{"qr_hash": "...", "scanned_at": "ISO 8601"}, ...]}.
+    Conflitos entre aparelhos: vale a leitura mais antiga (first-scan-wins pelo horário da leitura).
+    """
+    party = db.session.get(Party, party_id) or abort(404)
+    check_scanner_permission(party)
+    data = request.get_json(silent=True) or {}
+    scans, since = data.get('scans') or [], data.get('since')
+    if not isinstance(scans, list) or len(scans) > CHECK_IN_BATCH_MAX_SCANS:
+        return jsonify({'error': f'Envie no máximo {CHECK_IN_BATCH_MAX_SCANS} leituras por lote.'}), 400
+    if since is not None and not isinstance(since, int):
+        return jsonify({'error': 'Versão do manifesto inválida.'}), 400
+
+    results = check_in_batch(party_id, scans, first_scan_wins=True, device=request_check_in_device()) if scans else []
+    return jsonify({**get_scanner_manifest(party, since), 'results': results})
+
+@app.route('/api/party/<int:party_id>/events', methods=['GET'])
+@login_required
+def party_events(party_id):
+    """
+    Stream SSE com os eventos ao vivo da festa. Cada mensagem traz uma lista de eventos; o tipo
+    "resync" pede para a página recarregar tudo (a conexão ficou para trás).
+    """
+    party = db.session.get(Party, party_id) or abort(404)
+    check_collaboration_permission(party)
+    subscriber = party_event_broker.subscribe(party_id, db.engine)
+    db.session.close() # A conexão fica aberta por muito tempo; não segura uma conexão do pool
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = subscriber.get(timeout=PARTY_EVENTS_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+        finally:
+            party_event_broker.unsubscribe(party_id, subscriber)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Sem buffer em proxies nginx
+    return response
+
+CHECK_IN_EVENTS_FIELDS = ['guest_id', 'kind', 'occurred_at', 'device', 'previous_occurred_at', 'guest_name']
+
+@app.route('/api/party/<int:party_id>/checkin_events', methods=['GET'])
+@login_required
+def get_checkin_events(party_id):
+    """
+    Histórico de entradas (painel "Histórico de Entradas" da análise de check-in), de forma incremental:
+    ?since=<cursor> devolve só os eventos registrados depois desse cursor (o 'cursor' da resposta anterior).
+    Horários em segundos desde a época; guest_id e guest_name são nulos para convidados que já foram
+    removidos e previous_occurred_at só vem preenchido em entry_corrected (o horário de entrada substituído).
+    """
+    party = db.session.get(Party, party_id) or abort(404)
+    check_collaboration_permission(party)
+    since = request.args.get('since', type=int)
+
+    # Como no manifesto do scanner, o cursor é a versão da festa: lida antes dos eventos e na ordem dos commits
+    version, guests_removed_version = db.session.execute(
+        db.select(Party.version, Party.guests_removed_version).where(Party.id == party_id)
+    ).one()
+    full = since is None or since < guests_removed_version or since > version
+    query = (
+        db.select(Guest.id, CheckInEvent.kind, CheckInEvent.occurred_at, CheckInEvent.device, CheckInEvent.previous_occurred_at, Guest.name)
+        .outerjoin(Guest, Guest.id == CheckInEvent.guest_id)
+        .where(CheckInEvent.party_id == party_id, CheckInEvent.version <= version)
+        .order_by(CheckInEvent.version, CheckInEvent.id)
+    )
+    if not full:
+        query = query.where(CheckInEvent.version > since)
+    events = [
+        [guest_id, kind, int(occurred_at.astimezone(BRASILIA_TZ).timestamp()), device,
+         int(previous_occurred_at.astimezone(BRASILIA_TZ).timestamp()) if previous_occurred_at else None, guest_name]
+        for guest_id, kind, occurred_at, device, previous_occurred_at, guest_name in db.session.execute(query)
+    ]
+    return jsonify({'cursor': version, 'full': full, 'fields': CHECK_IN_EVENTS_FIELDS, 'events': events})
+
+CHECKIN_HISTOGRAM_BUCKETS = {'minute': 60, '5min': 300, 'hour': 3600}
+CHECKIN_HISTOGRAM_MAX_BUCKETS = 10000
+
+def checkin_bucket_expression(column, bucket):
+    """Início do intervalo de `bucket` ao qual cada horário pertence, calculado no banco."""
+    if db.engine.dialect.name == 'postgresql':
+        if bucket == '5min':
+            return db.func.date_trunc('hour', column) + db.literal_column("interval '1 minute'") * (db.func.floor(db.extract('minute', column) / 5) * 5)
+        return db.func.date_trunc(bucket, column)
+    # SQLite não tem date_trunc: arredonda os segundos desde a época
+    seconds = CHECKIN_HISTOGRAM_BUCKETS[bucket]
+    return db.func.datetime(db.cast(db.func.strftime('%s', column), db.Integer) // seconds * seconds, 'unixepoch')
 
 @app.route('/api/party/<int:party_id>/checkin_data', methods=['GET'])
 @login_required
 def get_checkin_data(party_id):
     """
-    Retorna uma lista de todos os timestamps de check-in (em formato ISO)
-    para uma festa, a fim de construir o gráfico de check-in por hora.
+    Dados do gráfico de check-ins. Com ?bucket=minute|5min|hour, devolve as contagens já agrupadas
+    no banco: {'start': início do primeiro intervalo, 'bucket_seconds', 'counts'}, com um valor por
+    intervalo (zeros incluídos) até o último check-in. Sem bucket, devolve a lista de todos os
+    timestamps de check-in (em formato ISO), como antes. ?start= e ?end= (ISO 8601) limitam o período.
     """
     party = db.session.get(Party, party_id) or abort(404)
     check_collaboration_permission(party)
+    not_modified = party_not_modified(party.version)
+    if not_modified: return not_modified
 
-    # Consulta ao banco para pegar apenas os timestamps de check-in
-    # de convidados que realmente entraram.
-    check_ins = db.session.query(Guest.check_in_time).filter(
-        Guest.party_id == party_id,
-        Guest.entered == True,
-        Guest.check_in_time.isnot(None)
-    ).all()
+    bucket = request.args.get('bucket')
+    if bucket is not None and bucket not in CHECKIN_HISTOGRAM_BUCKETS:
+        return jsonify({'error': f"Agrupamento inválido. Use: {', '.join(CHECKIN_HISTOGRAM_BUCKETS)}."}), 400
+    try:
+        start, end = (datetime.fromisoformat(request.args[name].replace('Z', '+00:00')) if request.args.get(name) else None for name in ('start', 'end'))
+    except ValueError:
+        return jsonify({'error': 'Período inválido: use datas no formato ISO 8601.'}), 400
+
+    # Apenas os timestamps de check-in de convidados que realmente entraram
+    filters = [Guest.party_id == party_id, Guest.entered == True, Guest.check_in_time.isnot(None)]
+    if start is not None:
+        filters.append(Guest.check_in_time >= start)
+    if end is not None:
+        filters.append(Guest.check_in_time < end)
+
+    if bucket is not None:
+        bucket_seconds = CHECKIN_HISTOGRAM_BUCKETS[bucket]
+        bucket_start = checkin_bucket_expression(Guest.check_in_time, bucket).label('bucket_start')
+        counts = {}
+        for bucket_time, count in db.session.execute(
+            db.select(bucket_start, db.func.count()).where(*filters).group_by(bucket_start)
+        ):
+            if isinstance(bucket_time, str): # SQLite devolve texto
+                bucket_time = datetime.fromisoformat(bucket_time)
+            counts[int(bucket_time.astimezone(BRASILIA_TZ).timestamp())] = count
+        if not counts:
+            return with_party_etag(jsonify({'bucket': bucket, 'bucket_seconds': bucket_seconds, 'start': None, 'counts': []}), party.version)
+        first, last = min(counts), max(counts)
+        if (last - first) // bucket_seconds >= CHECKIN_HISTOGRAM_MAX_BUCKETS:
+            return jsonify({'error': 'Período longo demais para esse agrupamento.'}), 400
+        return with_party_etag(jsonify({
+            'bucket': bucket, 'bucket_seconds': bucket_seconds,
+            'start': datetime.fromtimestamp(first, BRASILIA_TZ).isoformat(),
+            'counts': [counts.get(timestamp, 0) for timestamp in range(first, last + 1, bucket_seconds)]
+        }), party.version)
+
+    check_ins = db.session.query(Guest.check_in_time).filter(*filters).all()
 
     # Extrai os timestamps da tupla retornada pela query e converte para string ISO
     # O formato ISO é ideal para ser parseado pelo JavaScript
@@ -1166,7 +2674,7 @@ def get_checkin_data(party_id):
         for check_in_time in check_ins
     ]
 
-    return jsonify({'check_ins': timestamps})
+    return with_party_etag(jsonify({'check_ins': timestamps}), party.version)
 
 @app.route('/api/party/<int:party_id>/guests/<qr_hash>/edit', methods=['PUT'])
 @login_required
@@ -1178,6 +2686,7 @@ def edit_guest_name(party_id, qr_hash):
 
     guest.name = new_name
     db.session.commit()
+    invite_card_cache.invalidate_guest(party_id, qr_hash)
     return jsonify({'id': guest.id, 'name': guest.name, 'qr_hash': guest.qr_hash, 'entered': guest.entered, 'qr_image_url': guest.qr_image_url, 'check_in_time': guest.get_check_in_time_str(), 'message': f'Nome do convidado atualizado.'}), 200
 
 @app.route('/api/party/<int:party_id>/guests/<qr_hash>/toggle_entry', methods=['PUT'])
@@ -1193,11 +2702,18 @@ def toggle_entry_manually(party_id, qr_hash):
         # For now, we'll just proceed with the toggle.
         pass
 
+    now = datetime.now(BRASILIA_TZ)
     guest.entered = not guest.entered
-    guest.check_in_time = datetime.now(BRASILIA_TZ) if guest.entered else None
+    guest.check_in_time = now if guest.entered else None
     action = "marcado(a) como PRESENTE" if guest.entered else "marcado(a) como AUSENTE"
+    db.session.add(CheckInEvent(
+        party_id=party_id, guest_id=guest.id, occurred_at=now, user_id=current_user.id,
+        kind=CHECK_IN_EVENT_MANUAL_ENTRY if guest.entered else CHECK_IN_EVENT_MANUAL_EXIT
+    ))
+    db.session.flush()
+    counters = get_party_counters(party_id)
     db.session.commit()
-    return jsonify({'id': guest.id, 'name': guest.name, 'qr_hash': guest.qr_hash, 'entered': guest.entered, 'message': f'Status de {guest.name} alterado: {action}.', 'check_in_time': guest.get_check_in_time_str()})
+    return jsonify({'id': guest.id, 'name': guest.name, 'qr_hash': guest.qr_hash, 'entered': guest.entered, 'message': f'Status de {guest.name} alterado: {action}.', 'check_in_time': guest.get_check_in_time_str(), 'counters': counters})
 
 @app.route('/api/party/<int:party_id>/guests/<qr_hash>', methods=['DELETE'])
 @login_required
@@ -1213,28 +2729,34 @@ def delete_guest(party_id, qr_hash):
 
     db.session.delete(guest)
     db.session.commit()
+    invite_card_cache.invalidate_guest(party_id, qr_hash)
     return jsonify({'message': f'Convidado {guest_name} removido com sucesso.'}), 200
 
 class PDF(FPDF):
-    def __init__(self, orientation='P', unit='mm', format='A4', party_name=''):
+    def __init__(self, orientation='P', unit='mm', format='A4', party_name='', report_title=None):
         super().__init__(orientation, unit, format)
         self.montserrat_font_path = FONT_PATH
+        self.report_title = report_title or f'Relatório do Evento: {party_name}'
         self.font_name = 'Montserrat'
         self.default_font = 'Helvetica'
         self.current_font_family = self.default_font
         self.party_name = party_name
         if os.path.exists(self.montserrat_font_path):
             try:
+                # Negrito e itálico usam o mesmo arquivo da Montserrat Regular, então registramos
+                # a fonte uma única vez (cada add_font analisa o TTF inteiro) e set_font ignora B/I.
                 self.add_font(self.font_name, '', self.montserrat_font_path)
-                self.add_font(self.font_name, 'B', self.montserrat_font_path)
-                self.add_font(self.font_name, 'I', self.montserrat_font_path)
                 self.current_font_family = self.font_name
             except Exception:
                 app.logger.warning(f"Erro ao carregar fonte Montserrat de {self.montserrat_font_path}. Usando fonte padrão.")
                 pass
+    def set_font(self, family=None, style='', size=0):
+        if family and family.lower() == self.font_name.lower() and isinstance(style, str):
+            style = ''.join(c for c in style.upper() if c not in 'BI')
+        super().set_font(family, style, size)
     def header(self):
         self.set_font(self.current_font_family, 'B', 16)
-        title, title_w = f'Relatório do Evento: {self.party_name}', self.get_string_width(f'Relatório do Evento: {self.party_name}')
+        title, title_w = self.report_title, self.get_string_width(self.report_title)
         self.set_x((self.w - title_w) / 2)
         self.cell(title_w, 10, title, border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
         self.ln(5)
@@ -1319,6 +2841,26 @@ class PDF(FPDF):
         self.image(img_buffer, x=(self.w - chart_size_mm) / 2, y=self.get_y(), w=chart_size_mm)
         self.set_y(self.get_y() + chart_size_mm + 5)
 
+    def draw_guest_badge(self, x, y, scale, template_image, layout, qr_png, guest_name, name_font_family, name_color):
+        """
+        Desenha um crachá: o template da festa (imagem compartilhada por todos os crachás do PDF),
+        o QR Code do convidado por cima e o nome como texto. `scale` converte pixels do template em mm.
+        """
+        self.image(template_image, x=x, y=y, w=layout['canvas_width'] * scale, h=layout['canvas_height'] * scale)
+        qr_x, qr_y = layout['qr_position']
+        self.image(io.BytesIO(qr_png), x=x + qr_x * scale, y=y + qr_y * scale, w=layout['qr_size'] * scale, h=layout['qr_size'] * scale)
+
+        name_width = CARD_WIDTH * scale
+        font_size = 36 * scale / 0.3528  # 36px do convite convertidos para pontos
+        self.set_font(name_font_family, '', font_size)
+        while font_size > 4 and self.get_string_width(guest_name) > name_width * 0.95:
+            font_size -= 0.5
+            self.set_font(name_font_family, '', font_size)
+        self.set_text_color(*name_color)
+        self.set_xy(x + layout['card_x'] * scale, y + layout['guest_name_y'] * scale)
+        self.cell(name_width, layout['guest_name_height'] * scale, guest_name, border=0, align='C')
+        self.set_text_color(0, 0, 0)
+
     def chapter_body(self, guests_data_table):
         self.set_font(self.current_font_family, 'B', 11)
         self.cell(0, 10, "Lista de Convidados", border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
@@ -1400,6 +2942,113 @@ def export_guests_csv(party_id):
         ])
     return Response(si.getvalue(), mimetype="text/csv", headers={"Content-disposition": f"attachment; filename=lista_{party.name.replace(' ', '_')}.csv"})
 
+@app.route('/api/party/<int:party_id>/export/cards')
+@login_required
+def export_guest_cards_zip(party_id):
+    """Baixa um ZIP com o convite (PNG) de cada convidado com ingresso pago ou gratuito."""
+    party = db.session.get(Party, party_id) or abort(404)
+    check_collaboration_permission(party)
+    guests = get_eligible_guests_for_cards(party_id)
+    # O gerador roda depois que a view retorna: usamos uma cópia da festa, desligada da sessão
+    party_snapshot = party_render_snapshot(party)
+
+    def generate():
+        buffer = StreamingBuffer()
+        # PNG já é comprimido: ZIP_STORED evita gastar CPU recomprimindo
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zip_file:
+            for qr_hash, name, png_data in render_invite_cards(party_snapshot, guests):
+                if png_data is None:
+                    app.logger.error(f"Convite de {name} ({qr_hash}) não pôde ser gerado para o ZIP.")
+                    continue
+                safe_name = secure_filename(name) or 'convidado'
+                zip_file.writestr(f"{safe_name}_{qr_hash[:8]}.png", png_data)
+                yield buffer.pop()
+        yield buffer.pop()
+
+    filename = f"convites_{secure_filename(party.name) or party.id}.zip"
+    return Response(generate(), mimetype='application/zip', headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+# Crachás por página A4 -> (colunas, linhas)
+BADGE_SHEET_LAYOUTS = {1: (1, 1), 2: (2, 1), 4: (2, 2), 6: (3, 2), 9: (3, 3)}
+BADGE_REFERENCE_NAME = "ÁÇgjy"  # Altura máxima do nome (acentos e descendentes) para o template
+BADGE_QR_SIZE = 264  # Caixa do QR Code no crachá, em px (a de um qr_hash de 32 caracteres); cada QR é ajustado a ela
+# O PDF é montado inteiro em memória antes do envio (o fpdf2 só serializa no final), então limitamos o tamanho
+BADGE_PDF_MAX_GUESTS = int(os.environ.get('BADGE_PDF_MAX_GUESTS', 2000))
+PDF_STREAM_CHUNK_SIZE = 64 * 1024
+
+@app.route('/api/party/<int:party_id>/export/badges')
+@login_required
+def export_guest_badges_pdf(party_id):
+    """PDF para impressão com N crachás por página A4, para convidados sem celular."""
+    party = db.session.get(Party, party_id) or abort(404)
+    check_collaboration_permission(party)
+    per_page = request.args.get('per_page', 4, type=int)
+    if per_page not in BADGE_SHEET_LAYOUTS:
+        return jsonify({'error': f"per_page deve ser um de {sorted(BADGE_SHEET_LAYOUTS)}."}), 400
+    columns, rows = BADGE_SHEET_LAYOUTS[per_page]
+
+    guests = get_eligible_guests_for_cards(party_id)
+    if len(guests) > BADGE_PDF_MAX_GUESTS:
+        return jsonify({'error': f"O PDF de crachás aceita até {BADGE_PDF_MAX_GUESTS} convidados; esta festa tem {len(guests)}. Use o ZIP de convites."}), 400
+    party_snapshot = party_render_snapshot(party)
+    timestamp = datetime.now(BRASILIA_TZ).strftime("%Y%m%d_%H%M%S")
+    filename = f"crachas_{party.name.replace(' ', '_')}_{timestamp}.pdf"
+
+    def generate():
+        # O template da festa (gradiente, logo, nome da festa, rodapé) entra no PDF uma única vez;
+        # cada crachá só adiciona o QR Code (PNG de 1 bit) e o nome como texto.
+        font_name = resolve_invite_font_name(party_snapshot.invite_font)
+        font_guest_name = get_invite_font(font_name, 36)
+        guest_name_height = font_guest_name.getbbox(BADGE_REFERENCE_NAME)[3]
+        style, template = get_party_card_template(party_snapshot, font_name, BADGE_QR_SIZE, guest_name_height)
+        layout = {
+            'canvas_width': template['canvas'].width, 'canvas_height': template['canvas'].height,
+            'qr_position': template['qr_position'], 'qr_size': BADGE_QR_SIZE, 'card_x': template['name_position'][0],
+            'guest_name_y': template['name_position'][1], 'guest_name_height': guest_name_height,
+        }
+
+        pdf = PDF(party_name=party_snapshot.name, report_title=f'Crachás: {party_snapshot.name}')
+        pdf.set_auto_page_break(auto=False)
+        pdf.alias_nb_pages()
+        name_font_family = pdf.current_font_family
+        try:
+            pdf.add_font('Convite', '', os.path.join(FONTS_DIR, f"{font_name}.ttf"))
+            name_font_family = 'Convite'
+        except Exception as e:
+            app.logger.warning(f"Não foi possível usar a fonte {font_name} no PDF de crachás: {e}")
+
+        template_io = io.BytesIO()
+        template['canvas'].save(template_io, format='JPEG', quality=90)
+        template_image, _, _ = preload_image(pdf.image_cache, template_io)
+
+        gap = 4
+        area_top, area_bottom = 25, pdf.h - 18
+        cell_w = (pdf.w - pdf.l_margin - pdf.r_margin) / columns
+        cell_h = (area_bottom - area_top) / rows
+        scale = min((cell_w - gap) / layout['canvas_width'], (cell_h - gap) / layout['canvas_height'])
+        badge_w, badge_h = layout['canvas_width'] * scale, layout['canvas_height'] * scale
+
+        for index, ((qr_hash, name, _), qr_png) in enumerate(map_in_render_pool(_render_guest_qr_batch, guests)):
+            slot = index % per_page
+            if slot == 0:
+                pdf.add_page()
+            column, row = slot % columns, slot // columns
+            x = pdf.l_margin + column * cell_w + (cell_w - badge_w) / 2
+            y = area_top + row * cell_h + (cell_h - badge_h) / 2
+            pdf.draw_guest_badge(x, y, scale, template_image, layout, qr_png, name, name_font_family, style['guest_name_color'])
+
+        if not guests:
+            pdf.add_page()
+            pdf.set_font(pdf.current_font_family, 'I', 10)
+            pdf.cell(0, 10, "Nenhum convidado com ingresso emitido.", 0, 1, 'C')
+
+        # O fpdf2 só serializa o documento inteiro no final; enviamos o resultado em blocos
+        pdf_output = bytes(pdf.output())
+        for start in range(0, len(pdf_output), PDF_STREAM_CHUNK_SIZE):
+            yield pdf_output[start:start + PDF_STREAM_CHUNK_SIZE]
+
+    return Response(generate(), mimetype='application/pdf', headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @app.route('/api/party/<int:party_id>/export/pdf')
 @login_required
 def export_guests_pdf(party_id):
@@ -0,0 +1,323 @@
+"""
+Benchmark da renderização dos convites (generate_qr_code_image e get_vibrant_colors).
+
+Mede uma matriz de fontes x logos (sem logo, pequeno, foto de 4000px) x tamanho do nome x
+formato de saída e informa p50/p99 da latência, pico de RSS e convites por segundo por núcleo
+(tempo de CPU do processo). Também mede o template "frio" de cada logo e a extração de paleta.
+O pico de RSS é o de cada caso, acima do RSS com que o caso começou (no Linux o pico do processo
+é zerado antes de cada caso; nos outros sistemas a coluna fica vazia).
+
+Roda offline, com logos sintéticos e uma festa de mentira, sem banco de dados:
+    python benchmark_render.py
+    python benchmark_render.py --fonts Montserrat-Regular --formats PNG --json atual.json
+    python benchmark_render.py --baseline atual.json   # sai com código 1 se houver regressão
+    python benchmark_render.py --legacy                # compara com as versões antigas em Python puro
+"""
+import os
+import io
+import sys
+import json
+import time
+import hashlib
+import argparse
+import ctypes
+import gc
+import colorsys
+import shutil
+import statistics
+import tempfile
+
+# O app exige essas variáveis na importação; o benchmark não acessa o banco e grava os
+# logos de teste em uma pasta temporária.
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('ABACATE_API_KEY', 'benchmark')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+TEMP_STORAGE_PATH = None
+if not os.environ.get('STORAGE_BASE_PATH'):
+    TEMP_STORAGE_PATH = os.environ['STORAGE_BASE_PATH'] = tempfile.mkdtemp(prefix='qrpass_benchmark_')
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import app as qrpass
+
+ITERATIONS = 30
+LOGO_SIZE = (1200, 800)
+FIXTURE_LOGO_FILENAME = 'benchmark_logo.png'
+
+GUEST_NAMES = {
+    'curto': 'Ana',
+    'medio': 'Maria Eduarda dos Santos',
+    'longo': 'Pedro Henrique de Albuquerque Cavalcanti Júnior',
+}
+OUTPUT_FORMATS = ['PNG', 'JPEG', 'WEBP']
+DEFAULT_TOLERANCE = 0.15
+
+
+def legacy_get_vibrant_colors(pil_img, num_colors=2):
+    img = pil_img.copy().convert("RGBA")
+    img.thumbnail((100, 100))
+    all_colors = img.getcolors(img.size[0] * img.size[1])
+    if not all_colors: return []
+    vibrant_candidates = []
+    for count, rgba in all_colors:
+        r, g, b, a = rgba
+        if a < 128: continue
+        h, s, v = colorsys.rgb_to_hsv(r / 255.0, g / 255.0, b / 255.0)
+        if s > 0.35 and 0.3 < v < 0.95:
+            score = (s * 0.8) + (count / (img.size[0] * img.size[1]) * 0.2)
+            vibrant_candidates.append({'color': (r, g, b), 'score': score})
+    if not vibrant_candidates: return []
+    vibrant_candidates.sort(key=lambda x: x['score'], reverse=True)
+    return [c['color'] for c in vibrant_candidates[:num_colors]]
+
+
+def legacy_draw_vertical_gradient(width, height, start_color, end_color):
+    canvas = Image.new('RGB', (width, height), start_color)
+    draw = ImageDraw.Draw(canvas)
+    for y in range(height):
+        ratio = y / height
+        color_tuple = tuple(int(start * (1 - ratio) + end * ratio) for start, end in zip(start_color, end_color))
+        draw.line([(0, y), (width, y)], fill=color_tuple)
+    return canvas
+
+
+def make_fixture_logo(size=LOGO_SIZE, seed=42):
+    """Logo sintético com muitas cores (ruído sobre faixas), o pior caso para a extração de paleta."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    red, green, blue = np.broadcast_arrays(220 * x + 20 * y, 40 + 150 * y + 0 * x, 200 - 160 * x + 0 * y)
+    base = np.concatenate([red, green, blue], axis=2)
+    noise = rng.integers(-25, 25, size=(height, width, 3))
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8)).convert('RGBA')
+
+
+def make_small_logo(size=200):
+    """Logo pequeno com transparência (círculo colorido sobre fundo transparente)."""
+    logo = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).ellipse((10, 10, size - 10, size - 10), fill=(230, 57, 70, 255))
+    return logo
+
+
+class StubParty:
+    def __init__(self, logo_filename=None, invite_font='Montserrat-Regular', name='Festa de Benchmark', party_id=0,
+                 logo_card_filename=None, logo_palette=None):
+        self.id = party_id
+        self.name = name
+        self.logo_filename = logo_filename
+        # Sem logo_card_filename, a renderização decodifica o logo original (caminho antigo)
+        self.logo_card_filename = logo_card_filename
+        self.logo_palette = logo_palette
+        self.invite_font = invite_font
+
+
+def timed(func, iterations=ITERATIONS):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def measure(func, iterations):
+    """Executa func(i) `iterations` vezes. Retorna p50/p99 (ms) e convites/s por núcleo (tempo de CPU)."""
+    samples = []
+    rss_tracked = reset_peak_rss()
+    rss_start = read_proc_status_kb('VmRSS') if rss_tracked else None
+    cpu_start = time.process_time()
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    cpu_seconds = time.process_time() - cpu_start
+    p99 = statistics.quantiles(samples, n=100, method='inclusive')[98] if len(samples) > 1 else samples[0]
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(p99, 3),
+        'cards_per_sec_core': round(iterations / cpu_seconds, 1) if cpu_seconds > 0 else None,
+        'peak_rss_mb': round((read_proc_status_kb('VmHWM') - rss_start) / 1024, 1) if rss_tracked else None,
+    }
+
+
+def reset_peak_rss():
+    """
+    Devolve ao sistema a memória livre do heap e zera o pico de RSS (VmHWM) do processo, para o
+    próximo caso não aproveitar páginas deixadas pelos anteriores. Retorna False fora do Linux.
+    """
+    gc.collect()
+    try:
+        ctypes.CDLL(None).malloc_trim(0) # glibc; em outras libc o símbolo não existe
+    except (OSError, AttributeError):
+        pass
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_proc_status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1])
+    return 0
+
+
+def qr_hash_for(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()[:32]
+
+
+def clear_template_caches():
+    qrpass._card_styles.clear()
+    qrpass._card_templates.clear()
+
+
+def render_cold_card(party):
+    clear_template_caches()
+    return qrpass.generate_qr_code_image('BENCHMARKQRHASH0123456789ABCDEF', 'Convidado de Benchmark', party)
+
+
+def prepare_fixture_parties():
+    """Grava os logos de teste passando pela ingestão do app. Retorna {rótulo: (festa, logo decodificado)}."""
+    fixtures = {'sem logo': (StubParty(party_id=1), None)}
+    logos = {
+        'pequeno 200px': (make_small_logo(), 'PNG'),
+        # Gerada menor e ampliada para o próprio fixture não dominar o pico de RSS
+        'foto 4000px': (make_fixture_logo(size=(1000, 750), seed=7).convert('RGB').resize((4000, 3000), Image.Resampling.BICUBIC), 'JPEG'),
+    }
+    for party_id, (label, (logo, image_format)) in enumerate(logos.items(), start=2):
+        upload = io.BytesIO()
+        logo.save(upload, format=image_format)
+        upload.seek(0)
+        logo_filename, card_filename, palette = qrpass.ingest_party_logo(upload, party_id)
+        party = StubParty(logo_filename=logo_filename, party_id=party_id,
+                          logo_card_filename=card_filename, logo_palette=palette)
+        fixtures[label] = (party, logo)
+    return fixtures
+
+
+def run_matrix(fonts, formats, iterations):
+    fixtures = prepare_fixture_parties()
+    results = []
+
+    def record(kind, label, stats):
+        results.append({'kind': kind, 'case': label, **stats})
+        print(f"{kind:<10}{label:<58}{stats['p50_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+              f"{stats['cards_per_sec_core'] or 0:>12.1f}{'-' if stats['peak_rss_mb'] is None else stats['peak_rss_mb']:>12}")
+
+    print(f"{'tipo':<10}{'caso':<58}{'p50 ms':>9}{'p99 ms':>9}{'conv/s/núcl':>12}{'pico RSS MB':>12}")
+
+    # --- Extração de paleta (feita uma vez por logo, na ingestão ou no caminho antigo) ---
+    for logo_label, (_, logo) in fixtures.items():
+        if logo is not None:
+            record('paleta', logo_label, measure(lambda i: qrpass.get_vibrant_colors(logo), iterations))
+
+    # --- Template frio (primeiro convite da festa/fonte) ---
+    legacy_party = StubParty(logo_filename=fixtures['foto 4000px'][0].logo_filename, party_id=99)
+    cold_cases = [(label, party) for label, (party, _) in fixtures.items()] + [('foto 4000px, sem ingestão', legacy_party)]
+    for logo_label, party in cold_cases:
+        for font in fonts:
+            party.invite_font = font
+            def cold_render(i, party=party):
+                clear_template_caches()
+                qrpass.generate_qr_code_image(qr_hash_for(i), GUEST_NAMES['medio'], party)
+            record('frio', f"{logo_label} | {font}", measure(cold_render, max(3, iterations // 4)))
+
+    # --- Convites com o template da festa já montado ---
+    for logo_label, (party, _) in fixtures.items():
+        for font in fonts:
+            party.invite_font = font
+            for name_label, guest_name in GUEST_NAMES.items():
+                for output_format in formats:
+                    qrpass.generate_qr_code_image(qr_hash_for(-1), guest_name, party, output_format=output_format) # aquece
+                    def warm_render(i, party=party, guest_name=guest_name, output_format=output_format):
+                        qrpass.generate_qr_code_image(qr_hash_for(i), guest_name, party, output_format=output_format)
+                    record('convite', f"{logo_label} | {font} | {name_label} | {output_format}", measure(warm_render, iterations))
+    return results
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """Compara o p50 de cada caso com um resultado anterior (--json). Retorna a lista de regressões."""
+    with open(baseline_path) as f:
+        baseline = {(row['kind'], row['case']): row for row in json.load(f)['results']}
+    regressions = []
+    for row in results:
+        previous = baseline.get((row['kind'], row['case']))
+        if previous and row['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append((row['kind'], row['case'], previous['p50_ms'], row['p50_ms']))
+    return regressions
+
+
+def run_legacy_comparison():
+    logo = make_fixture_logo()
+    logo.save(os.path.join(qrpass.PARTY_LOGOS_SAVE_PATH, FIXTURE_LOGO_FILENAME))
+    party = StubParty(logo_filename=FIXTURE_LOGO_FILENAME)
+
+    # --- Conferência de equivalência ---
+    assert legacy_get_vibrant_colors(logo) == qrpass.get_vibrant_colors(logo), "Paleta diferente da versão antiga"
+    size, start, end = (680, 1300), (60, 10, 90), (120, 20, 180)
+    legacy_gradient = np.asarray(legacy_draw_vertical_gradient(*size, start, end))
+    new_gradient = np.asarray(qrpass.draw_vertical_gradient(*size, start, end))
+    assert np.array_equal(legacy_gradient, new_gradient), "Gradiente diferente da versão antiga"
+
+    # --- Funções isoladas ---
+    print(f"{'etapa':<28}{'antes (ms)':>12}{'depois (ms)':>14}")
+    rows = [
+        ('get_vibrant_colors', lambda: legacy_get_vibrant_colors(logo), lambda: qrpass.get_vibrant_colors(logo)),
+        ('gradiente 680x1300', lambda: legacy_draw_vertical_gradient(*size, start, end), lambda: qrpass.draw_vertical_gradient(*size, start, end)),
+    ]
+    for label, before, after in rows:
+        print(f"{label:<28}{timed(before):>12.2f}{timed(after):>14.2f}")
+
+    # --- Convite completo sem template em cache ---
+    current_colors, current_gradient = qrpass.get_vibrant_colors, qrpass.draw_vertical_gradient
+    try:
+        qrpass.get_vibrant_colors, qrpass.draw_vertical_gradient = legacy_get_vibrant_colors, legacy_draw_vertical_gradient
+        before = timed(lambda: render_cold_card(party))
+    finally:
+        qrpass.get_vibrant_colors, qrpass.draw_vertical_gradient = current_colors, current_gradient
+    after = timed(lambda: render_cold_card(party))
+    print(f"{'convite (frio, com logo)':<28}{before:>12.2f}{after:>14.2f}")
+
+    os.remove(os.path.join(qrpass.PARTY_LOGOS_SAVE_PATH, FIXTURE_LOGO_FILENAME))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da renderização dos convites.")
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help="Repetições por caso (padrão: %(default)s).")
+    parser.add_argument('--fonts', nargs='+', default=qrpass.ALLOWED_INVITE_FONTS, choices=qrpass.ALLOWED_INVITE_FONTS)
+    parser.add_argument('--formats', nargs='+', default=OUTPUT_FORMATS, choices=OUTPUT_FORMATS)
+    parser.add_argument('--json', help="Grava os resultados neste arquivo (serve de --baseline depois).")
+    parser.add_argument('--baseline', help="Resultado anterior (--json) para detectar regressões no p50.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Piora aceita no p50 (padrão: %(default)s).")
+    parser.add_argument('--legacy', action='store_true', help="Compara com as versões antigas do gradiente e da paleta.")
+    args = parser.parse_args()
+
+    try:
+        if args.legacy:
+            run_legacy_comparison()
+            return
+        results = run_matrix(args.fonts, args.formats, args.iterations)
+    finally:
+        if TEMP_STORAGE_PATH:
+            shutil.rmtree(TEMP_STORAGE_PATH, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'iterations': args.iterations, 'cpu_count': os.cpu_count(), 'results': results}, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for kind, case, before, after in regressions:
+            print(f"REGRESSÃO {kind} {case}: p50 {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            sys.exit(1)
+        print("Sem regressões em relação ao baseline.")
+
+
+if __name__ == '__main__':
+    main()
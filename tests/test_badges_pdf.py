@@ -0,0 +1,28 @@
+"""PDF de crachás para impressão (GET .../export/badges)."""
+import app as app_module
+
+
+def export_badges(client, party, **params):
+    return client.get(f'/api/party/{party.id}/export/badges', query_string=params)
+
+
+def test_badges_pdf_has_every_guest(client, party, add_guests):
+    add_guests(5)
+
+    response = export_badges(client, party, per_page=4)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert response.data.startswith(b'%PDF')
+    assert response.data.count(b'/Type /Page\n') == 2
+
+
+def test_party_over_the_limit_is_refused_before_building_the_pdf(client, party, add_guests, monkeypatch):
+    monkeypatch.setattr(app_module, 'BADGE_PDF_MAX_GUESTS', 2)
+    add_guests(3)
+
+    response = export_badges(client, party)
+
+    assert response.status_code == 400
+    assert response.mimetype == 'application/json'
+    assert '2 convidados' in response.get_json()['error']
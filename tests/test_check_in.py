@@ -0,0 +1,39 @@
+"""Check-in pelo scanner (POST .../enter), em qualquer banco."""
+from app import db, Guest
+
+
+def enter(client, party, guest):
+    return client.post(f'/api/party/{party.id}/guests/{guest.qr_hash}/enter')
+
+
+def test_second_scan_of_the_same_ticket_is_already_entered(client, party, add_guests):
+    guest, = add_guests(1)
+
+    first, second = enter(client, party, guest), enter(client, party, guest)
+
+    assert first.status_code == second.status_code == 200
+    assert first.get_json()['is_new_entry']
+    assert not second.get_json()['is_new_entry']
+    assert second.get_json()['message'].startswith(f'{guest.name} já entrou às ')
+    assert second.get_json()['check_in_time'] == first.get_json()['check_in_time']
+    assert db.session.scalar(db.select(Guest.entered).where(Guest.id == guest.id))
+
+
+def test_unpaid_ticket_is_payment_pending(client, party, add_guests):
+    party.ticket_price = 50
+    db.session.commit()
+    guest, = add_guests(1, payment_status='pending')
+
+    response = enter(client, party, guest)
+
+    assert response.status_code == 403
+    assert response.get_json()['error_type'] == 'payment_pending'
+    assert not db.session.scalar(db.select(Guest.entered).where(Guest.id == guest.id))
+
+
+def test_ticket_of_another_party_is_invalid(client, party, add_guests):
+    guest, = add_guests(1)
+
+    response = client.post(f'/api/party/{party.id + 1000}/guests/{guest.qr_hash}/enter')
+
+    assert response.status_code == 404
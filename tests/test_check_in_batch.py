@@ -0,0 +1,36 @@
+"""Check-in em lote (POST .../enter_batch): permissão do scanner e janela das leituras offline."""
+from datetime import datetime, timedelta
+
+from app import db, BRASILIA_TZ, CHECK_IN_MAX_OFFLINE_HOURS, CHECK_IN_NEW_ENTRY, CHECK_IN_SCAN_EXPIRED, Guest
+
+
+def enter_batch(client, party, scans):
+    return client.post(f'/api/party/{party.id}/guests/enter_batch', json={'scans': scans})
+
+
+def test_batch_needs_the_party_code_or_a_collaborator(app, party, add_guests):
+    guest, = add_guests(1)
+    client = app.test_client()
+
+    assert enter_batch(client, party, [{'qr_hash': guest.qr_hash}]).status_code == 403
+    assert not db.session.scalar(db.select(Guest.entered).where(Guest.id == guest.id))
+
+    client.set_cookie('party_code', party.party_code)
+    result, = enter_batch(client, party, [{'qr_hash': guest.qr_hash}]).get_json()['results']
+    assert result['outcome'] == CHECK_IN_NEW_ENTRY
+
+
+def test_scan_older_than_the_offline_window_is_refused(client, party, add_guests):
+    old_guest, recent_guest = add_guests(2)
+    now = datetime.now(BRASILIA_TZ)
+    scans = [
+        {'qr_hash': old_guest.qr_hash, 'scanned_at': (now - timedelta(hours=CHECK_IN_MAX_OFFLINE_HOURS + 1)).isoformat()},
+        {'qr_hash': recent_guest.qr_hash, 'scanned_at': (now - timedelta(hours=1)).isoformat()},
+    ]
+
+    old_result, recent_result = enter_batch(client, party, scans).get_json()['results']
+
+    assert (old_result['outcome'], old_result['status']) == (CHECK_IN_SCAN_EXPIRED, 400)
+    assert recent_result['outcome'] == CHECK_IN_NEW_ENTRY
+    entered = dict(db.session.execute(db.select(Guest.id, Guest.entered).where(Guest.party_id == party.id)).all())
+    assert entered == {old_guest.id: False, recent_guest.id: True}
@@ -0,0 +1,61 @@
+"""
+Vários scanners lendo ao mesmo tempo. Só roda no PostgreSQL: o SQLite serializa as escritas e não
+reproduz a corrida entre transações em READ COMMITTED (o resultado sequencial está em test_check_in).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import db, CheckInEvent, CHECK_IN_EVENT_ENTRY, Guest, Party
+
+pytestmark = pytest.mark.usefixtures('postgresql')
+
+SCANNERS = 12
+
+
+def scan_all(app, party_id, qr_hashes):
+    """Dispara um POST .../enter por ingresso, cada um em sua thread, todos liberados juntos."""
+    barrier = threading.Barrier(len(qr_hashes))
+
+    def scan(qr_hash):
+        client = app.test_client()
+        barrier.wait()
+        return client.post(f'/api/party/{party_id}/guests/{qr_hash}/enter').get_json()
+
+    with ThreadPoolExecutor(len(qr_hashes)) as pool:
+        return list(pool.map(scan, qr_hashes))
+
+
+def test_same_ticket_from_many_scanners_enters_once(app, party, add_guests):
+    guest, = add_guests(1)
+    party_id, guest_id, qr_hash, version = party.id, guest.id, guest.qr_hash, party.version
+
+    results = scan_all(app, party_id, [qr_hash] * SCANNERS)
+
+    assert sum(result['is_new_entry'] for result in results) == 1
+    assert all(result['entered'] for result in results)
+    assert len({result['check_in_time'] for result in results}) == 1
+    db.session.expire_all()
+    guest, party = db.session.get(Guest, guest_id), db.session.get(Party, party_id)
+    assert guest.entered
+    assert party.entered_count == 1
+    assert party.version == version + 1
+    assert guest.version == party.version
+    events = db.session.scalars(db.select(CheckInEvent).where(CheckInEvent.guest_id == guest_id)).all()
+    assert [event.kind for event in events] == [CHECK_IN_EVENT_ENTRY]
+
+
+def test_different_tickets_at_once_keep_every_entry(app, party, add_guests):
+    guests = add_guests(SCANNERS)
+    party_id, guest_ids, version = party.id, [guest.id for guest in guests], party.version
+
+    results = scan_all(app, party_id, [guest.qr_hash for guest in guests])
+
+    assert all(result['is_new_entry'] for result in results)
+    db.session.expire_all()
+    party = db.session.get(Party, party_id)
+    assert party.entered_count == SCANNERS
+    assert party.version == version + SCANNERS
+    versions = db.session.scalars(db.select(Guest.version).where(Guest.id.in_(guest_ids))).all()
+    assert sorted(versions) == list(range(version + 1, version + SCANNERS + 1))
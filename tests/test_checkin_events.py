@@ -0,0 +1,38 @@
+"""Histórico de entradas (GET .../checkin_events), buscado de forma incremental pelo painel da análise."""
+from app import CHECK_IN_EVENT_ENTRY, CHECK_IN_EVENT_MANUAL_EXIT
+
+
+def history(client, party, since=None):
+    data = client.get(f'/api/party/{party.id}/checkin_events', query_string={} if since is None else {'since': since}).get_json()
+    return data, [dict(zip(data['fields'], values)) for values in data['events']]
+
+
+def test_since_cursor_returns_only_the_new_events(client, party, add_guests):
+    first, second = add_guests(2)
+    client.post(f'/api/party/{party.id}/guests/{first.qr_hash}/enter')
+
+    data, events = history(client, party)
+    assert data['full']
+    assert [(event['guest_name'], event['kind']) for event in events] == [(first.name, CHECK_IN_EVENT_ENTRY)]
+
+    client.post(f'/api/party/{party.id}/guests/{second.qr_hash}/enter')
+    client.put(f'/api/party/{party.id}/guests/{first.qr_hash}/toggle_entry')
+
+    data, events = history(client, party, since=data['cursor'])
+    assert not data['full']
+    assert [(event['guest_name'], event['kind']) for event in events] == [
+        (second.name, CHECK_IN_EVENT_ENTRY), (first.name, CHECK_IN_EVENT_MANUAL_EXIT)
+    ]
+    assert history(client, party, since=data['cursor'])[1] == []
+
+
+def test_removing_a_guest_resends_the_whole_history(client, party, add_guests):
+    guest, = add_guests(1)
+    client.post(f'/api/party/{party.id}/guests/{guest.qr_hash}/enter')
+    cursor = history(client, party)[0]['cursor']
+
+    client.delete(f'/api/party/{party.id}/guests/{guest.qr_hash}')
+
+    data, events = history(client, party, since=cursor)
+    assert data['full']
+    assert [(event['guest_id'], event['guest_name']) for event in events] == [(None, None)]
@@ -0,0 +1,58 @@
+"""A lista de convidados custa um número fixo de consultas, qualquer que seja o tamanho da página."""
+import secrets
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import db, User
+
+GUESTS = 40
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture
+def guests(add_guests):
+    # Cada convidado com um comprador diferente: com carregamento preguiçoso, seria uma consulta por linha
+    guests = add_guests(GUESTS, payment_status='paid')
+    for guest in guests:
+        guest.purchaser = User(username=f'comprador-{secrets.token_hex(4)}', email=f'{secrets.token_hex(4)}@teste.com', password_hash='x')
+    db.session.commit()
+    return guests
+
+
+def list_guests(app, client, party_id, **params):
+    # Contexto próprio, como uma requisição de verdade: sessão e usuário logado sem nada em cache
+    with app.app_context(), count_statements() as statements:
+        response = client.get(f'/api/party/{party_id}/guests', query_string=params)
+    assert response.status_code == 200
+    return response.get_json(), len(statements)
+
+
+# Usuário logado (e as festas em que colabora), festa e a página; na busca, mais a contagem
+@pytest.mark.parametrize('params, expected_statements', [
+    ({}, 4),
+    ({'search': 'convidado'}, 5),
+    ({'sort_by': 'added_by', 'cursor': ''}, 4),
+])
+def test_guest_list_query_count_does_not_grow_with_page_size(app, client, party, guests, params, expected_statements):
+    small_page, small_count = list_guests(app, client, party.id, per_page=5, **params)
+    full_page, full_count = list_guests(app, client, party.id, per_page=GUESTS, **params)
+
+    assert len(small_page['guests']) == 5
+    assert len(full_page['guests']) == GUESTS
+    assert all(guest['purchased_by'].startswith('comprador-') for guest in full_page['guests'])
+    assert small_count == full_count == expected_statements
@@ -0,0 +1,29 @@
+"""PartyStatsCache: invalidação por festa com memória limitada."""
+from app import PartyStatsCache
+
+
+def test_computation_started_before_an_invalidation_is_not_stored():
+    cache = PartyStatsCache(ttl=60, max_items=2)
+    _, stale_generation = cache.get(1)
+    cache.invalidate(1)
+    # Outras festas empurram a marca da festa 1 para fora; o cálculo antigo continua recusado
+    cache.invalidate(2)
+    cache.invalidate(3)
+
+    cache.set(1, stale_generation, 'antigo')
+    assert cache.get(1)[0] is None
+
+    _, generation = cache.get(1)
+    cache.set(1, generation, 'novo')
+    assert cache.get(1)[0] == 'novo'
+
+
+def test_invalidations_stay_within_the_item_limit():
+    cache = PartyStatsCache(ttl=60, max_items=3)
+    for party_id in range(100):
+        _, generation = cache.get(party_id)
+        cache.set(party_id, generation, party_id)
+        cache.invalidate(party_id)
+
+    assert len(cache._invalidations) == 3
+    assert len(cache._items) == 0
@@ -0,0 +1,38 @@
+"""Sincronização do scanner offline: conflitos entre aparelhos (vale a leitura mais antiga)."""
+from datetime import datetime, timedelta
+
+from app import (db, BRASILIA_TZ, CheckInEvent, CHECK_IN_EVENT_ENTRY, CHECK_IN_EVENT_ENTRY_CORRECTED,
+                 CHECK_IN_ALREADY_ENTERED, CHECK_IN_PAYMENT_PENDING, Guest, Party)
+
+
+def test_earlier_offline_scan_corrects_the_entry_without_a_second_one(client, party, add_guests):
+    guest, = add_guests(1)
+    assert client.post(f'/api/party/{party.id}/guests/{guest.qr_hash}/enter').get_json()['is_new_entry']
+    online_check_in_time = db.session.scalar(db.select(Guest.check_in_time).where(Guest.id == guest.id))
+    scanned_at = (datetime.now(BRASILIA_TZ) - timedelta(hours=1)).isoformat()
+
+    response = client.post(f'/api/party/{party.id}/scanner/sync', json={'scans': [{'qr_hash': guest.qr_hash, 'scanned_at': scanned_at}]})
+
+    result, = response.get_json()['results']
+    assert result['outcome'] == CHECK_IN_ALREADY_ENTERED
+    assert not result['is_new_entry']
+    db.session.expire_all()
+    assert db.session.get(Party, party.id).entered_count == 1
+    events = db.session.scalars(db.select(CheckInEvent).where(CheckInEvent.guest_id == guest.id).order_by(CheckInEvent.id)).all()
+    assert [event.kind for event in events] == [CHECK_IN_EVENT_ENTRY, CHECK_IN_EVENT_ENTRY_CORRECTED]
+    assert events[1].previous_occurred_at == online_check_in_time
+    assert events[1].occurred_at == db.session.get(Guest, guest.id).check_in_time < online_check_in_time
+    history = client.get(f'/api/party/{party.id}/checkin_events').get_json()
+    assert history['events'][-1][history['fields'].index('previous_occurred_at')] is not None
+
+
+def test_offline_scan_of_an_unpaid_ticket_is_payment_pending(client, party, add_guests):
+    party.ticket_price = 50
+    db.session.commit()
+    guest, = add_guests(1, payment_status='pending')
+
+    response = client.post(f'/api/party/{party.id}/scanner/sync', json={'scans': [{'qr_hash': guest.qr_hash}]})
+
+    result, = response.get_json()['results']
+    assert result['outcome'] == CHECK_IN_PAYMENT_PENDING
+    assert not db.session.scalar(db.select(Guest.entered).where(Guest.id == guest.id))